@@ -0,0 +1,313 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, initializedcheck=False
+"""
+Native backtracking interpreter for the bytecode compiled by `RegexEngine`.
+
+It runs the same program as `RegexEngine.match_inner`, but as a typed C loop that undoes
+capture writes from a log instead of snapshotting them. It prunes the same states too,
+so both interpreters stay polynomial on the same patterns. Build it in place with:
+
+    cythonize -i _matcher.pyx
+
+`main.py` falls back to the pure Python interpreter when the extension is not built.
+"""
+from libc.stdlib cimport malloc, realloc, free
+from libc.string cimport memcmp
+
+# Opcodes; these must stay in sync with the OP_* constants in main.py.
+cdef enum:
+    OP_LITERAL = 0
+    OP_CLASS = 1
+    OP_STAR = 2
+    OP_SPLIT = 3
+    OP_JUMP = 4
+    OP_LOOP = 5
+    OP_GROUP_START = 6
+    OP_GROUP_END = 7
+    OP_BACKREF = 8
+    OP_BOL = 9
+    OP_EOL = 10
+    OP_MATCH = 11
+    OP_UTF8 = 12
+
+# How a state is memoized, per instruction (the `memo` argument).
+cdef enum:
+    MEMO_NONE = 0      # never pruned
+    MEMO_POSITION = 1  # pruned by (pc, pos) in the visited bitset
+    MEMO_CAPTURES = 2  # pruned by (pc, pos, relevant captures) in the visited set
+
+# Kinds of saved choice points.
+cdef enum:
+    RESUME_AT = 0      # continue at (pc, pos)
+    RESUME_STAR = 1    # retry the OP_STAR at pc with a run ending at pos
+
+cdef struct Choice:
+    int kind
+    int pc
+    Py_ssize_t pos
+    Py_ssize_t low
+    Py_ssize_t log_len
+
+cdef struct Undo:
+    Py_ssize_t reg
+    Py_ssize_t value
+
+
+cdef Py_ssize_t _utf8_length(const unsigned char[:] text, Py_ssize_t pos, int *code_point):
+    """
+    Decodes the well-formed UTF-8 character at text[pos] into `code_point` and returns
+    its length, or 0 if none starts there (same rules as main._decode_utf8).
+    """
+    cdef Py_ssize_t n_text = text.shape[0], length, i
+    cdef int lead = text[pos], byte, value
+    if lead < 0x80:
+        code_point[0] = lead
+        return 1
+    if lead < 0xC2 or lead > 0xF4:
+        return 0
+    length = 2 if lead < 0xE0 else 3 if lead < 0xF0 else 4
+    if pos + length > n_text:
+        return 0
+    value = lead & (0x3F >> (length - 1))
+    for i in range(pos + 1, pos + length):
+        byte = text[i]
+        if byte & 0xC0 != 0x80:
+            return 0
+        value = (value << 6) | (byte & 0x3F)
+    if ((length == 3 and value < 0x800) or (length == 4 and value < 0x10000)
+            or 0xD800 <= value <= 0xDFFF or value > 0x10FFFF):
+        return 0
+    code_point[0] = value
+    return length
+
+
+cdef bint _in_ranges(const int[:] bounds, Py_ssize_t first, Py_ssize_t last, int code_point):
+    """Binary search for `code_point` in the sorted low, high pairs bounds[first:last]."""
+    cdef Py_ssize_t low = 0, high = (last - first) // 2, middle
+    while low < high:
+        middle = (low + high) // 2
+        if code_point < bounds[first + 2 * middle]:
+            high = middle
+        elif code_point > bounds[first + 2 * middle + 1]:
+            low = middle + 1
+        else:
+            return True
+    return False
+
+
+cdef int _push_choice(Choice **stack, Py_ssize_t *size, Py_ssize_t *capacity, int kind, int pc,
+                      Py_ssize_t pos, Py_ssize_t low, Py_ssize_t log_len) except -1:
+    """Pushes a choice point, growing the stack geometrically."""
+    cdef Choice *grown
+    if size[0] == capacity[0]:
+        grown = <Choice *> realloc(stack[0], 2 * capacity[0] * sizeof(Choice))
+        if grown == NULL:
+            raise MemoryError()
+        stack[0] = grown
+        capacity[0] *= 2
+    stack[0][size[0]].kind = kind
+    stack[0][size[0]].pc = pc
+    stack[0][size[0]].pos = pos
+    stack[0][size[0]].low = low
+    stack[0][size[0]].log_len = log_len
+    size[0] += 1
+    return 0
+
+
+cdef int _set_register(Py_ssize_t *regs, Undo **log, Py_ssize_t *size, Py_ssize_t *capacity,
+                       Py_ssize_t reg, Py_ssize_t value) except -1:
+    """Writes a capture register, logging its old value so backtracking can undo it."""
+    cdef Undo *grown
+    if size[0] == capacity[0]:
+        grown = <Undo *> realloc(log[0], 2 * capacity[0] * sizeof(Undo))
+        if grown == NULL:
+            raise MemoryError()
+        log[0] = grown
+        capacity[0] *= 2
+    log[0][size[0]].reg = reg
+    log[0][size[0]].value = regs[reg]
+    size[0] += 1
+    regs[reg] = value
+    return 0
+
+
+def match(const signed char[:] ops, const int[:] arg1s, const int[:] arg2s,
+          const unsigned char[:] classes, const int[:] char_bounds, const int[:] char_offsets,
+          const unsigned char[:] memo, tuple memo_groups,
+          const unsigned char[:] text, Py_ssize_t start, int num_groups,
+          unsigned char[:] visited, set visited_captures, Py_ssize_t memo_limit):
+    """
+    Runs the program against `text` from offset `start`.
+
+    Args:
+        ops: The opcode of every instruction.
+        arg1s: The first argument of every instruction (a class id for OP_CLASS/OP_STAR), or -1.
+        arg2s: The second argument of every instruction, or -1.
+        classes: The 256-entry class tables used by OP_CLASS/OP_STAR, concatenated.
+        char_bounds: The low, high code point pairs of the OP_UTF8 classes, concatenated.
+        char_offsets: Where each OP_UTF8 class starts in `char_bounds`, plus its end.
+        memo: The MEMO_* kind of every instruction.
+        memo_groups: For every instruction, None or the (captured, started) groups whose
+            registers key its state.
+        text: The input line.
+        start: Offset to start matching at.
+        num_groups: Number of capture groups.
+        visited: Zeroed bitset of len(ops) * (len(text) + 1) bits, shared across calls
+            on the same line.
+        visited_captures: Keys of the MEMO_CAPTURES states visited on this line, in the
+            same representation as `visited`'s bits but with the capture registers added.
+        memo_limit: Size at which `visited_captures` is cleared to bound its memory.
+
+    Returns:
+        int: The offset where the first match ends, or -1 if there is none.
+    """
+    cdef Py_ssize_t n_text = text.shape[0]
+    cdef Py_ssize_t pos = start, end, length, bit, i
+    cdef Py_ssize_t result = -1
+    cdef int pc = 0, op, arg1, arg2, group, code_point
+    cdef bint failed
+    cdef tuple key, captured, started
+    cdef Py_ssize_t *regs
+    cdef Choice *stack
+    cdef Undo *log
+    cdef Choice choice
+    cdef Py_ssize_t stack_size = 0, stack_capacity = 64
+    cdef Py_ssize_t log_size = 0, log_capacity = 64
+
+    # Registers per group: 3g = start of the open group, 3g + 1 / 3g + 2 = last capture.
+    regs = <Py_ssize_t *> malloc((3 * num_groups + 1) * sizeof(Py_ssize_t))
+    stack = <Choice *> malloc(stack_capacity * sizeof(Choice))
+    log = <Undo *> malloc(log_capacity * sizeof(Undo))
+    if regs == NULL or stack == NULL or log == NULL:
+        free(regs)
+        free(stack)
+        free(log)
+        raise MemoryError()
+    for i in range(3 * num_groups):
+        regs[i] = -1
+
+    try:
+        while True:
+            op = ops[pc]
+            arg1 = arg1s[pc]
+            arg2 = arg2s[pc]
+            failed = False
+
+            # A memoizable state that was already visited either failed or is being explored.
+            if memo[pc] == MEMO_POSITION:
+                bit = pc * (n_text + 1) + pos
+                if visited[bit >> 3] & (1 << (bit & 7)):
+                    failed = True
+                else:
+                    visited[bit >> 3] |= 1 << (bit & 7)
+            elif memo[pc] == MEMO_CAPTURES:
+                # States that reach a backreference also depend on the captures it reads.
+                key = (pc, pos)
+                captured, started = memo_groups[pc]
+                for group in captured:
+                    key += (regs[3 * group + 1], regs[3 * group + 2])
+                for group in started:
+                    key += (regs[3 * group],)
+                if key in visited_captures:
+                    failed = True
+                else:
+                    if len(visited_captures) >= memo_limit:
+                        visited_captures.clear()
+                    visited_captures.add(key)
+
+            if failed:
+                pass
+            elif op == OP_LITERAL:
+                if pos < n_text and text[pos] == arg1:
+                    pos += 1
+                    pc += 1
+                else:
+                    failed = True
+            elif op == OP_CLASS:
+                if pos < n_text and classes[arg1 * 256 + text[pos]]:
+                    pos += 1
+                    pc += 1
+                else:
+                    failed = True
+            elif op == OP_UTF8:
+                length = _utf8_length(text, pos, &code_point) if pos < n_text else 0
+                if length and _in_ranges(char_bounds, char_offsets[arg1], char_offsets[arg1 + 1], code_point):
+                    pos += length
+                    pc += 1
+                else:
+                    failed = True
+            elif op == OP_STAR:
+                # Take the longest run first; shorter runs are retried on backtracking.
+                end = pos
+                while end < n_text and classes[arg1 * 256 + text[end]]:
+                    end += 1
+                if end > pos:
+                    _push_choice(&stack, &stack_size, &stack_capacity, RESUME_STAR, pc, end - 1, pos, log_size)
+                pos = end
+                pc += 1
+            elif op == OP_SPLIT:
+                _push_choice(&stack, &stack_size, &stack_capacity, RESUME_AT, arg2, pos, 0, log_size)
+                pc = arg1
+            elif op == OP_JUMP:
+                pc = arg1
+            elif op == OP_LOOP:
+                # Only repeat if the last iteration consumed input, otherwise it would never end.
+                if arg2 < 0 or arg2 >= num_groups or regs[3 * arg2 + 1] != regs[3 * arg2 + 2]:
+                    _push_choice(&stack, &stack_size, &stack_capacity, RESUME_AT, pc + 1, pos, 0, log_size)
+                    pc = arg1
+                else:
+                    pc += 1
+            elif op == OP_GROUP_START:
+                _set_register(regs, &log, &log_size, &log_capacity, 3 * arg1, pos)
+                pc += 1
+            elif op == OP_GROUP_END:
+                _set_register(regs, &log, &log_size, &log_capacity, 3 * arg1 + 1, regs[3 * arg1])
+                _set_register(regs, &log, &log_size, &log_capacity, 3 * arg1 + 2, pos)
+                pc += 1
+            elif op == OP_BACKREF:
+                if arg1 >= num_groups or regs[3 * arg1 + 2] < 0:
+                    failed = True
+                else:
+                    length = regs[3 * arg1 + 2] - regs[3 * arg1 + 1]
+                    if pos + length <= n_text and (
+                            length == 0 or memcmp(&text[pos], &text[regs[3 * arg1 + 1]], length) == 0):
+                        pos += length
+                        pc += 1
+                    else:
+                        failed = True
+            elif op == OP_BOL:
+                if pos == 0:
+                    pc += 1
+                else:
+                    failed = True
+            elif op == OP_EOL:
+                if pos == n_text:
+                    pc += 1
+                else:
+                    failed = True
+            else:  # OP_MATCH
+                result = pos
+                break
+
+            if not failed:
+                continue
+            # Backtrack to the most recent choice point, undoing capture writes made since.
+            if stack_size == 0:
+                break
+            stack_size -= 1
+            choice = stack[stack_size]
+            while log_size > choice.log_len:
+                log_size -= 1
+                regs[log[log_size].reg] = log[log_size].value
+            if choice.kind == RESUME_STAR:
+                if choice.pos > choice.low:
+                    _push_choice(&stack, &stack_size, &stack_capacity, RESUME_STAR, choice.pc,
+                                 choice.pos - 1, choice.low, log_size)
+                pc = choice.pc + 1
+            else:
+                pc = choice.pc
+            pos = choice.pos
+    finally:
+        free(regs)
+        free(stack)
+        free(log)
+    return result
@@ -1,87 +1,339 @@
+import mmap
 import os
+import stat
 import sys
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from array import array
+from typing import NamedTuple
 
-class RegexEngine:
+try:
+    # Optional compiled backtracker (see _matcher.pyx); the pure Python one is used otherwise.
+    from _matcher import match as native_match
+except ImportError:
+    native_match = None
+
+# Bytecode opcodes. Each instruction is a tuple (opcode, arg1, arg2); execution falls
+# through to pc + 1 unless the instruction says otherwise. The backtracker runs the same
+# program split into parallel `ops`/`arg1`/`arg2` arrays (see _build_program_arrays).
+OP_LITERAL = 0      # (OP_LITERAL, byte, None)        consume one byte equal to `byte`
+OP_CLASS = 1        # (OP_CLASS, table, None)         consume one byte accepted by the 256-entry `table`
+OP_STAR = 2         # (OP_STAR, table, None)          greedily consume zero or more bytes accepted by `table`
+OP_SPLIT = 3        # (OP_SPLIT, x, y)                try pc x first, then pc y
+OP_JUMP = 4         # (OP_JUMP, x, None)              continue at pc x
+OP_LOOP = 5         # (OP_LOOP, x, group)             repeat from pc x (if `group` made progress) or fall through
+OP_GROUP_START = 6  # (OP_GROUP_START, group, None)   record where capture `group` starts
+OP_GROUP_END = 7    # (OP_GROUP_END, group, None)     store the text captured by `group`
+OP_BACKREF = 8      # (OP_BACKREF, group, None)       consume the text captured by `group`
+OP_BOL = 9          # (OP_BOL, None, None)            assert the start of the input ('^')
+OP_EOL = 10         # (OP_EOL, None, None)            assert the end of the input ('$')
+OP_MATCH = 11       # (OP_MATCH, None, None)          the whole pattern matched
+OP_UTF8 = 12        # (OP_UTF8, ranges, None)         consume one UTF-8 character whose code point is in `ranges`
+
+# Upper bound on the number of cached DFA states before the cache is flushed.
+DFA_CACHE_LIMIT = 4096
+# Lower bound on the number of remembered backtracking failures per input line; the
+# actual bound grows with the line (see RegexEngine.has_match).
+FAIL_MEMO_LIMIT = 65536
+# Upper bound on the same memo whatever the line length (a few hundred MB of keys at most).
+FAIL_MEMO_CEILING = 1 << 20
+# Matched lines are collected in a buffer and written out once it grows past this size.
+OUTPUT_FLUSH_BYTES = 65536
+# Pages of a memory-mapped file that were already scanned are released in steps this size.
+MMAP_RELEASE_BYTES = 8 << 20
+
+class CompiledProgram(NamedTuple):
     """
-    A simple regular expression engine that supports a subset of regex features,
-    including literals, character classes, escape sequences (\\d, \\w), quantifiers (+, ?, *),
-    the wildcard (.), groups for alternation (cat|dog), quantifiers on groups,
-    multiple and nested backreferences (\\1, \\2), and anchors (^, $).
+    Everything compiled from one pattern. It is never modified after compilation, so
+    every engine for the same pattern shares one instance (see _compile_pattern).
+    """
+    code: tuple                 # The bytecode program as (opcode, arg1, arg2) tuples.
+    match_pc: int               # Program counter of OP_MATCH.
+    end_pc: int                 # The instruction that accepts at the end of the input.
+    num_capture_groups: int
+    start_anchored: bool        # The program begins with OP_BOL.
+    end_anchored: bool          # The program ends with OP_EOL before OP_MATCH.
+    has_backreferences: bool
+    required_literal: bytes | None
+    literal_prefix: bytes | None
+    first_byte_table: bytes | None
+    has_prefilter: bool
+    shift_or: tuple | None      # Shift-Or tables, for short linear patterns.
+    dfa_start: frozenset | None # Start state of the lazy DFA, for regular patterns.
+    # The backtracker's program, only built for patterns with backreferences.
+    memo_groups: tuple | None
+    ops: memoryview | None      # Read-only views of the parallel program arrays.
+    arg1: memoryview | None
+    arg2: memoryview | None
+    class_tables: bytes | None
+    # Code point ranges of the OP_UTF8 classes: (lows, highs) per class id for the Python
+    # interpreter, and flattened for the native one (bounds[offsets[id]:offsets[id + 1]]
+    # holds the class's low, high pairs).
+    char_ranges: tuple | None
+    char_bounds: memoryview | None
+    char_offsets: memoryview | None
+    native_memo: bytes | None
+    # The same pattern without the non-ASCII branches of classes and '.', for ASCII lines.
+    ascii_program: "CompiledProgram | None"
 
-    This implementation uses a generator-based backtracking approach to find all
-    possible matches.
+def _epsilon_closure(code: tuple, pcs) -> frozenset:
     """
-    def __init__(self, pattern: str):
-        """
-        Initializes the regex engine.
+    Follows the non-consuming instructions of `code` reachable from the given program
+    counters. Only consuming and accepting instructions are kept, so equivalent DFA
+    states share a single key. Used both while compiling and by the lazy DFA.
+    """
+    closure = set()
+    seen = set()
+    stack = list(pcs)
+    while stack:
+        pc = stack.pop()
+        if pc in seen:
+            continue
+        seen.add(pc)
+        op, arg1, arg2 = code[pc]
+        if op == OP_SPLIT:
+            stack.append(arg2)
+            stack.append(arg1)
+        elif op == OP_LOOP:
+            stack.append(pc + 1)
+            stack.append(arg1)
+        elif op == OP_JUMP:
+            stack.append(arg1)
+        elif op == OP_GROUP_START or op == OP_GROUP_END:
+            stack.append(pc + 1)
+        elif op == OP_BOL:
+            # OP_BOL can only be the first instruction, and pc 0 is only re-entered
+            # after the first byte when there is none, so here it always holds.
+            stack.append(pc + 1)
+        elif op == OP_STAR:
+            # Either consume another byte in place or move past the repetition.
+            closure.add(pc)
+            stack.append(pc + 1)
+        else:
+            # Consuming instructions, OP_MATCH, and OP_EOL, which only accepts at the end.
+            closure.add(pc)
+    return frozenset(closure)
 
-        Args:
-            pattern (str): The regular expression pattern to be used for matching.
-        """
-        # Store the user-provided regex pattern as an instance variable.
-        self.pattern = pattern
-        # Initialize a list to store the strings captured by groups. Will be sized later.
-        self.captures = []
-        # Pre-calculate the number of capture groups in the pattern for capture list initialization.
-        self.num_capture_groups = self._count_capture_groups(self.pattern)
+@lru_cache(maxsize=None)
+def _escape_ranges(escape: str) -> tuple:
+    """
+    Returns the code point ranges matched by the escape \\d (str.isdigit) or \\w
+    (str.isalnum, plus '_'), with the same Unicode meaning they had when lines were
+    matched as str. Built on first use, since it tests every code point once.
+    """
+    test = str.isdigit if escape == "d" else str.isalnum
+    # Decoding the code points as UTF-32 builds the string of all of them in C.
+    every_character = array("I", range(0x110000)).tobytes().decode(
+        "utf-32-le" if sys.byteorder == "little" else "utf-32-be", "surrogatepass")
+    flags = bytearray(map(test, every_character))
+    if escape == "w":
+        flags[ord("_")] = 1
+    # Surrogates cannot occur in UTF-8 input.
+    flags[0xD800:0xE000] = bytes(0x800)
+    ranges = []
+    low = flags.find(1)
+    while low >= 0:
+        high = flags.find(0, low)
+        if high < 0:
+            high = len(flags)
+        ranges.append((low, high - 1))
+        low = flags.find(1, high)
+    return tuple(ranges)
 
-    def _count_capture_groups(self, pattern: str) -> int:
-        """Counts the number of capturing groups '(' in the pattern, ignoring escaped ones."""
-        count = 0
-        i = 0
-        while i < len(pattern):
-            # We must ignore escaped parentheses like '\('.
-            if pattern[i] == '\\':
-                i += 2 # Skip the backslash and the character after it.
-            elif pattern[i] == '(':
-                count += 1
-                i += 1
-            else:
-                i += 1
-        return count
+def _decode_utf8(data: bytes, pos: int) -> tuple:
+    """
+    Decodes the UTF-8 character at `data[pos]`, accepting exactly the well-formed
+    sequences (no overlong forms, surrogates or code points past U+10FFFF).
 
-    # ---------- Character Type Checks ----------
-    def is_digit(self, c: str) -> bool:
-        """Checks if a character is a numeric digit ('0'-'9')."""
-        return c.isdigit()
+    Returns:
+        tuple: (code point, length in bytes), or (-1, 0) if no character starts there.
+    """
+    lead = data[pos]
+    if lead < 0x80:
+        return lead, 1
+    if lead < 0xC2 or lead > 0xF4:
+        return -1, 0
+    length = 2 if lead < 0xE0 else 3 if lead < 0xF0 else 4
+    if pos + length > len(data):
+        return -1, 0
+    code_point = lead & (0x3F >> (length - 1))
+    for i in range(pos + 1, pos + length):
+        byte = data[i]
+        if byte & 0xC0 != 0x80:
+            return -1, 0
+        code_point = code_point << 6 | byte & 0x3F
+    if (code_point < (0x80, 0x800, 0x10000)[length - 2] or 0xD800 <= code_point <= 0xDFFF
+            or code_point > 0x10FFFF):
+        return -1, 0
+    return code_point, length
 
-    def is_alpha(self, c: str) -> bool:
-        """Checks if a character is an alphabetic letter ('a'-'z', 'A'-'Z')."""
-        return c.isalpha()
+class PatternCompiler:
+    """
+    Compiles one pattern into a CompiledProgram: parses it into an AST, emits the
+    bytecode, and derives the prefilters and the tables of each matcher. A compiler is
+    used once and thrown away; engines only ever see the immutable program it returns.
+    """
+    # 256-entry lookup tables indexed by byte value: 1 if the byte matches, 0 otherwise.
+    # Every Unicode code point except the surrogates, which UTF-8 cannot encode.
+    ALL_CODE_POINTS = ((0x00, 0xD7FF), (0xE000, 0x10FFFF))
+    # The table accepting exactly one byte, for every byte value.
+    LITERAL_TABLES = tuple(bytes(256)[:b] + b"\x01" + bytes(255 - b) for b in range(256))
+
+    def __init__(self, pattern: str, ascii_only: bool = False):
+        """
+        Initializes the compiler.
 
-    def is_underscore(self, c: str) -> bool:
-        """Checks if a character is an underscore ('_')."""
-        return c == "_"
+        Args:
+            pattern (str): The regular expression pattern to compile.
+            ascii_only (bool): Compile classes and '.' for ASCII input only.
+        """
+        self.pattern = pattern
+        self.ascii_only = ascii_only
+        # Whether a class or '.' got multi-byte UTF-8 branches.
+        self.has_wide_classes = False
+        # Parser state: whether a backreference was seen, and the next group number.
+        self.has_backreferences = False
+        self._next_group = 0
 
-    # ---------- Utility for Matching Character Classes ----------
-    def match_class(self, c: str, class_str: str, negated: bool = False) -> bool:
+    # ---------- Character Class Tables ----------
+    def _class_ranges(self, class_str: str, negated: bool = False) -> list:
         """
-        Checks if a character `c` matches the rules of a character class string (e.g., "[a-z0-range]").
+        Resolves a character class string (e.g., "a-z0-9_") to the sorted, disjoint
+        code point ranges it accepts, scanning the class once. A negated class accepts
+        every other code point.
+
+        Returns:
+            list: (low, high) pairs of inclusive code point bounds.
         """
-        matched = False
+        ranges = []
         i = 0
         while i < len(class_str):
             # Handle character ranges like 'a-z'.
             if i + 2 < len(class_str) and class_str[i + 1] == "-":
-                if class_str[i] <= c <= class_str[i + 2]:
-                    matched = True
-                    break
+                low, high = ord(class_str[i]), ord(class_str[i + 2])
+                if low <= high:
+                    ranges.append((low, high))
                 i += 3
             # Handle single characters.
             else:
-                if class_str[i] == c:
-                    matched = True
-                    break
+                ranges.append((ord(class_str[i]), ord(class_str[i])))
                 i += 1
+        merged = []
+        for low, high in sorted(ranges):
+            if merged and low <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], high))
+            else:
+                merged.append((low, high))
         # Apply negation if the class starts with '^'.
-        return not matched if negated else matched
+        if negated:
+            complement = []
+            for low, high in self.ALL_CODE_POINTS:
+                for excluded_low, excluded_high in merged:
+                    if excluded_high < low or excluded_low > high:
+                        continue
+                    if excluded_low > low:
+                        complement.append((low, excluded_low - 1))
+                    low = excluded_high + 1
+                if low <= high:
+                    complement.append((low, high))
+            merged = complement
+        return merged
+
+    def _utf8_sequences(self, low: int, high: int) -> list:
+        """
+        Splits the code point range [low, high] into UTF-8 byte range sequences: lists of
+        (low byte, high byte) pairs such that the range's encodings are exactly the byte
+        strings matching one of the sequences. Surrogates must already be excluded.
+        """
+        # Encodings of different lengths never share a sequence.
+        for boundary in (0x7F, 0x7FF, 0xFFFF):
+            if low <= boundary < high:
+                return self._utf8_sequences(low, boundary) + self._utf8_sequences(boundary + 1, high)
+        # Split until the bounds only differ in bytes where the whole
+        # continuation range (0x80-0xBF) follows.
+        for i in range(1, 4):
+            mask = (1 << (6 * i)) - 1
+            if low & ~mask != high & ~mask:
+                if low & mask:
+                    return self._utf8_sequences(low, low | mask) + self._utf8_sequences((low | mask) + 1, high)
+                if high & mask != mask:
+                    return self._utf8_sequences(low, (high & ~mask) - 1) + self._utf8_sequences(high & ~mask, high)
+        return [list(zip(chr(low).encode(), chr(high).encode()))]
+
+    def _class_node(self, ranges: list, quantifier) -> tuple:
+        """
+        Builds the AST node that accepts one character from the code point ranges of a
+        class, an escape or the wildcard. A class of ASCII characters (or any class when
+        compiling for ASCII input) is a single byte table; otherwise the node keeps the
+        ranges, and is compiled in _emit_node.
+        """
+        ascii_table = bytearray(256)
+        for low, high in ranges:
+            if low < 0x80:
+                ascii_table[low:min(high, 0x7F) + 1] = b"\x01" * (min(high, 0x7F) + 1 - low)
+        if self.ascii_only or not ranges or ranges[-1][1] < 0x80:
+            return ("bytes", bytes(ascii_table), quantifier)
+        self.has_wide_classes = True
+        return ("chars", tuple(ranges), quantifier)
+
+    def _utf8_alternatives(self, ranges: tuple) -> list:
+        """
+        Expands the code point ranges of a "chars" node into the alternatives of a group
+        over bytes: one table for the ASCII part, then byte range tables following the
+        UTF-8 encoding of the non-ASCII ranges.
+        """
+        ascii_table = bytearray(256)
+        sequences = []
+        for low, high in ranges:
+            if low < 0x80:
+                ascii_table[low:min(high, 0x7F) + 1] = b"\x01" * (min(high, 0x7F) + 1 - low)
+                low = 0x80
+            if low <= high:
+                sequences.extend(self._utf8_sequences(low, high))
+        alternatives = [[("bytes", bytes(ascii_table), None)]] if any(ascii_table) else []
+        alternatives.extend(self._sequence_alternatives(sequences))
+        return alternatives
+
+    def _sequence_alternatives(self, sequences: list) -> list:
+        """
+        Turns UTF-8 byte range sequences into the alternatives of a group, sharing common
+        parts so large classes such as \\w stay small: sequences that only differ in
+        their first byte range become one sequence with a merged first table, and
+        sequences that then start with the same table share it, followed by a nested
+        group of their remainders.
+        """
+        by_tail = {}
+        for sequence in sequences:
+            (first, last), tail = sequence[0], tuple(sequence[1:])
+            table = by_tail.setdefault(tail, bytearray(256))
+            table[first:last + 1] = b"\x01" * (last + 1 - first)
+        by_head = {}
+        for tail, table in by_tail.items():
+            by_head.setdefault(bytes(table), []).append(list(tail))
+        alternatives = []
+        for table, tails in by_head.items():
+            head = ("bytes", table, None)
+            if len(tails) == 1:
+                alternatives.append([head] + [("bytes", self._byte_range_table(first, last), None)
+                                              for first, last in tails[0]])
+            else:
+                alternatives.append([head, ("group", (None, self._sequence_alternatives(tails)), None)])
+        return alternatives
+
+    def _byte_range_table(self, low: int, high: int) -> bytes:
+        """Returns the lookup table that accepts the byte values low to high."""
+        if low == high:
+            return self._literal_table(low)
+        return bytes(low) + b"\x01" * (high + 1 - low) + bytes(255 - high)
 
     # ---------- Pattern Parsing ----------
-    def parse_single_atom(self, pattern: str) -> tuple:
+    def parse_single_atom(self, pattern: str, start: int = 0) -> tuple:
         """
-        Parses a single 'atom' (the smallest non-group unit) from the start of the pattern string.
+        Parses a single 'atom' (the smallest non-group unit) at offset `start` of the
+        pattern string. The returned length counts from `start`.
         """
-        p = 0
+        p = start
         negated = False
         # Handle escape sequences.
         if pattern[p] == "\\":
@@ -89,8 +341,11 @@ class RegexEngine:
             if p >= len(pattern):
                 raise RuntimeError("Incomplete escape sequence in pattern")
             esc = pattern[p]
-            # Check for backreferences (\1, \2, etc.).
-            if esc.isdigit():
+            # Check for backreferences (\1, \2, etc.). Groups are numbered from 1, so
+            # there is nothing for \0 to refer to.
+            if esc == "0":
+                raise RuntimeError("Invalid backreference \\0 in pattern")
+            elif esc in "123456789":
                 atom_type = "backreference"
                 atom = int(esc)
             # Check for character class escapes (\d, \w).
@@ -101,22 +356,22 @@ class RegexEngine:
             else:
                 atom_type = "literal"
                 atom = esc
-            atom_len = p + 1
+            atom_len = p + 1 - start
         # Handle character classes [...].
         elif pattern[p] == "[":
             p += 1
             if p < len(pattern) and pattern[p] == "^":
                 negated = True
                 p += 1
-            start = p
+            class_start = p
             while p < len(pattern) and pattern[p] != "]":
                 p += 1
             if p >= len(pattern):
                 raise RuntimeError("Pattern missing closing bracket ']'")
-            class_str = pattern[start:p]
+            class_str = pattern[class_start:p]
             atom_type = "class"
             atom = class_str
-            atom_len = p + 1
+            atom_len = p + 1 - start
         # Handle the wildcard '.'.
         elif pattern[p] == ".":
             atom_type = "wildcard"
@@ -129,261 +384,959 @@ class RegexEngine:
             atom_len = 1
         return atom_type, atom, atom_len, negated
 
-    def find_matching_paren(self, pattern: str, start_index: int = 0) -> int:
+    # ---------- Compilation (Bytecode / Thompson NFA) ----------
+    def compile(self) -> CompiledProgram:
         """
-        Finds the index of the matching closing parenthesis for a group, handling nested groups.
+        Parses the pattern once into an AST and compiles it to a flat bytecode program.
+        The program doubles as a Thompson NFA (one state per instruction) for the lazy
+        DFA, and is executed directly by the backtracker when the pattern contains
+        backreferences, which the DFA cannot handle.
         """
-        open_parens = 1
-        for i in range(start_index + 1, len(pattern)):
-            if pattern[i] == '(':
-                open_parens += 1
-            elif pattern[i] == ')':
-                open_parens -= 1
-            if open_parens == 0:
-                return i
-        raise RuntimeError("Pattern missing closing parenthesis ')'")
+        # Anchors are detected once here and compiled into OP_BOL/OP_EOL instructions.
+        pattern = self.pattern
+        start_anchored = pattern.startswith("^")
+        end_anchored = pattern.endswith("$")
+        inner = pattern[int(start_anchored):-int(end_anchored) or None]
+        ast = self._parse(inner)
+        # Groups are numbered while parsing, so the parser knows how many captures to size for.
+        num_capture_groups = self._next_group
+        code = self._compile(ast, start_anchored, end_anchored)
+        match_pc = len(code) - 1
+
+        # Literal facts used to skip input that cannot match before running any matcher.
+        required_literal = self._extract_required_literal(code)
+        literal_prefix = self._extract_literal_prefix(code)
+        first_byte_table = self._extract_first_bytes(code)
+
+        shift_or = dfa_start = None
+        memo_groups = ops = arg1s = arg2s = class_tables = native_memo = ascii_program = None
+        char_ranges = char_bounds = char_offsets = None
+        if self.has_backreferences:
+            memo_groups = self._build_memo_groups(code, num_capture_groups)
+            # Parallel typed arrays of the program, read by the backtracker per step.
+            (ops, arg1s, arg2s, class_tables,
+             char_ranges, char_bounds, char_offsets) = self._build_program_arrays(code)
+            # States whose outcome cannot depend on captures are pruned by (pc, pos) in a
+            # bitset (1), the others by (pc, pos, relevant captures) in a set (2).
+            native_memo = bytes(0 if groups is None else 2 if groups != ((), ()) else 1
+                                for groups in memo_groups)
+            # The UTF-8 branches turn a repeated '.' or class into a group loop, which is far
+            # slower to backtrack than OP_STAR. ASCII lines can never take those branches,
+            # so they run on a variant compiled without them.
+            if self.has_wide_classes:
+                ascii_program = PatternCompiler(pattern, ascii_only=True).compile()
+        else:
+            dfa_start = _epsilon_closure(code, [0])
+            # Short linear patterns can additionally run on the bit-parallel Shift-Or matcher.
+            shift_or = self._build_shift_or(ast)
+
+        return CompiledProgram(
+            code=code,
+            match_pc=match_pc,
+            # The instruction that accepts once the input is exhausted (OP_EOL or OP_MATCH).
+            end_pc=match_pc - 1 if end_anchored else match_pc,
+            num_capture_groups=num_capture_groups,
+            start_anchored=start_anchored,
+            end_anchored=end_anchored,
+            has_backreferences=self.has_backreferences,
+            required_literal=required_literal,
+            literal_prefix=literal_prefix,
+            first_byte_table=first_byte_table,
+            has_prefilter=not start_anchored and (
+                literal_prefix is not None or first_byte_table is not None),
+            shift_or=shift_or,
+            dfa_start=dfa_start,
+            memo_groups=memo_groups,
+            ops=ops,
+            arg1=arg1s,
+            arg2=arg2s,
+            class_tables=class_tables,
+            char_ranges=char_ranges,
+            char_bounds=char_bounds,
+            char_offsets=char_offsets,
+            native_memo=native_memo,
+            ascii_program=ascii_program,
+        )
+
+    def _parse(self, pattern: str) -> list:
+        """
+        Parses a pattern into a list of AST nodes by recursive descent over the pattern
+        string: a group's alternatives are read in the same left-to-right pass as
+        everything else, so no substring is ever rescanned for its parentheses or '|'.
+        Each node is a tuple (node_type, content, quantifier) where node_type is one of
+        "bytes", "group" or "backreference". Group content is (group_index, alternatives),
+        with a group_index of None for non-capturing groups.
+        """
+        nodes, _ = self._parse_sequence(pattern, 0, in_group=False)
+        return nodes
+
+    def _parse_sequence(self, pattern: str, p: int, in_group: bool) -> tuple:
+        """
+        Parses atoms and groups from offset `p` up to the end of the pattern or, inside a
+        group, up to its next top-level '|' or ')'. Outside a group both are literals.
+
+        Returns:
+            tuple: (nodes, offset where parsing stopped)
+        """
+        nodes = []
+        while p < len(pattern):
+            if in_group and pattern[p] in "|)":
+                break
+            if pattern[p] == "(":
+                # Groups are numbered in the order of their opening parenthesis.
+                group_index = self._next_group
+                self._next_group += 1
+                alternatives, p = self._parse_alternatives(pattern, p + 1)
+                expr_type = "group"
+            else:
+                expr_type, expr_content, expr_len, negated = self.parse_single_atom(pattern, p)
+                p += expr_len
+            quantifier = None
+            if p < len(pattern) and pattern[p] in "+?*":
+                quantifier = pattern[p]
+                p += 1
 
-    def split_alternatives(self, group_content: str) -> list[str]:
+            if expr_type == "group":
+                nodes.append(("group", (group_index, alternatives), quantifier))
+            elif expr_type == "backreference":
+                self.has_backreferences = True
+                nodes.append(("backreference", expr_content - 1, quantifier))
+            elif expr_type == "class":
+                nodes.append(self._class_node(self._class_ranges(expr_content, negated), quantifier))
+            elif expr_type == "wildcard":
+                nodes.append(self._class_node(self.ALL_CODE_POINTS, quantifier))
+            elif expr_type == "escape":
+                nodes.append(self._class_node(_escape_ranges(expr_content), quantifier))
+            elif expr_type == "literal" and not expr_content.isascii():
+                # A non-ASCII literal spans several UTF-8 bytes; a quantifier applies to all of them.
+                byte_nodes = [("bytes", self._literal_table(b), None) for b in expr_content.encode()]
+                if quantifier is None:
+                    nodes.extend(byte_nodes)
+                else:
+                    nodes.append(("group", (None, [byte_nodes]), quantifier))
+            else:
+                nodes.append(("bytes", self._literal_table(ord(expr_content)), quantifier))
+        return nodes, p
+
+    def _parse_alternatives(self, pattern: str, p: int) -> tuple:
         """
-        Splits a group's content string by the top-level alternation operator '|',
-        correctly ignoring '|' inside nested groups.
+        Parses the '|'-separated alternatives of a group whose '(' precedes offset `p`.
+        Nested groups, escapes and character classes are consumed by the sequence parser,
+        so a ')' or '|' inside them never ends an alternative.
+
+        Returns:
+            tuple: (list of alternatives' node lists, offset just past the closing ')')
         """
         alternatives = []
-        paren_level = 0
-        current_alternative_start = 0
-        for i, char in enumerate(group_content):
-            if char == '(':
-                paren_level += 1
-            elif char == ')':
-                paren_level -= 1
-            elif char == '|' and paren_level == 0:
-                alternatives.append(group_content[current_alternative_start:i])
-                current_alternative_start = i + 1
-        alternatives.append(group_content[current_alternative_start:])
-        return alternatives
+        while True:
+            nodes, p = self._parse_sequence(pattern, p, in_group=True)
+            alternatives.append(nodes)
+            if p >= len(pattern):
+                raise RuntimeError("Pattern missing closing parenthesis ')'")
+            p += 1
+            if pattern[p - 1] == ")":
+                return alternatives, p
 
-    def parse_expression(self, pattern: str) -> tuple:
+    def _literal_table(self, byte: int) -> bytes:
+        """Returns the lookup table that accepts exactly one byte value."""
+        return self.LITERAL_TABLES[byte]
+
+    def _compile(self, ast: list, start_anchored: bool, end_anchored: bool) -> tuple:
         """
-        Parses the next logical expression from the pattern (an atom or a group).
+        Compiles the AST into a list of (opcode, arg1, arg2) instructions ending in OP_MATCH,
+        framed by OP_BOL/OP_EOL for anchored patterns. Jump targets are absolute program
+        counters.
         """
-        if pattern.startswith('('):
-            end_paren_idx = self.find_matching_paren(pattern, 0)
-            group_content = pattern[1:end_paren_idx]
-            alternatives = self.split_alternatives(group_content)
-            return "group", alternatives, end_paren_idx + 1, False
+        code = []
+        if start_anchored:
+            code.append([OP_BOL, None, None])
+        self._emit_sequence(ast, code)
+        if end_anchored:
+            code.append([OP_EOL, None, None])
+        code.append([OP_MATCH, None, None])
+        return tuple(tuple(instruction) for instruction in code)
+
+    def _emit_sequence(self, nodes: list, code: list) -> None:
+        """Emits the instructions for a sequence of AST nodes."""
+        for node in nodes:
+            self._emit_node(node, code)
+
+    def _emit_node(self, node: tuple, code: list) -> None:
+        """Emits the instructions for a single (possibly quantified) AST node."""
+        node_type, content, quantifier = node
+        if node_type == "bytes":
+            if content.count(1) == 1:
+                single = [OP_LITERAL, content.index(1), None]
+            else:
+                single = [OP_CLASS, content, None]
+            # Single-byte atoms repeat with a dedicated greedy instruction instead of a loop.
+            if quantifier == "+":
+                code.append(single)
+                code.append([OP_STAR, content, None])
+            elif quantifier == "*":
+                code.append([OP_STAR, content, None])
+            else:
+                self._emit_quantified(lambda: code.append(single), quantifier, None, code)
+        elif node_type == "chars":
+            if self.has_backreferences:
+                # The backtracker decodes a whole character in one instruction.
+                self._emit_quantified(lambda: code.append([OP_UTF8, content, None]), quantifier, None, code)
+            else:
+                # The DFA consumes a byte per step, so it gets the UTF-8 encoding as bytes.
+                group = ("group", (None, self._utf8_alternatives(content)), quantifier)
+                self._emit_node(group, code)
+        elif node_type == "backreference":
+            # A repeated backreference only makes progress if its capture is non-empty.
+            self._emit_quantified(lambda: code.append([OP_BACKREF, content, None]), quantifier, content, code)
         else:
-            return self.parse_single_atom(pattern)
-
-    def get_match_fn(self, atom_type: str, atom: str, negated: bool) -> callable:
-        """
-        A factory that returns a specific function to check if a character matches a parsed atom.
-        """
-        if atom_type == "escape":
-            if atom == "d":
-                return self.is_digit
-            elif atom == "w":
-                return lambda c: self.is_alpha(c) or self.is_digit(c) or self.is_underscore(c)
-        elif atom_type == "literal":
-            return lambda c: c == atom
-        elif atom_type == "class":
-            return lambda c: self.match_class(c, atom, negated)
-        elif atom_type == "wildcard":
-            return lambda c: True
-        return None
+            group_index, alternatives = content
+            self._emit_quantified(lambda: self._emit_group(group_index, alternatives, code),
+                                  quantifier, group_index, code)
 
-    def match_inner(self, input_line: str, pattern: str, group_counter: int):
+    def _emit_quantified(self, emit_body: callable, quantifier, progress_group, code: list) -> None:
         """
-        The core matching function, re-implemented as a generator. It yields all
-        possible successful matches for a given state.
-
-        Yields:
-            tuple: A tuple of (match_length, final_group_counter) for each successful match path.
+        Wraps the instructions produced by `emit_body` in the control flow for a quantifier.
+        `progress_group` names the capture that tells whether an iteration consumed input,
+        so the backtracker can refuse to repeat an empty iteration forever.
         """
-        # Base case: An empty pattern successfully matches 0 characters.
-        if not pattern:
-            yield 0, group_counter
+        if quantifier is None:
+            emit_body()
             return
+        if quantifier in "?*":
+            skip = len(code)
+            code.append([OP_SPLIT, skip + 1, None])
+        body_start = len(code)
+        emit_body()
+        if quantifier in "+*":
+            code.append([OP_LOOP, body_start, progress_group])
+        if quantifier in "?*":
+            code[skip][2] = len(code)
 
-        # Parse the next expression and identify any following quantifier.
-        expr_type, expr_content, expr_len, negated = self.parse_expression(pattern)
-        quantifier = None
-        if expr_len < len(pattern) and pattern[expr_len] in "+?*":
-            quantifier = pattern[expr_len]
-        rest_of_pattern = pattern[expr_len + (1 if quantifier else 0):]
-
-        # --- Handle a GROUP expression ---
-        if expr_type == "group":
-            this_group_num = group_counter + 1
-            alternatives = expr_content
-
-            # A helper generator that matches the group content once.
-            # It yields (match_length, updated_group_counter) for each successful alternative.
-            def match_group_content_once(inp, grp_counter):
-                for alt in alternatives:
-                    # Each alternative is a new path, so save/restore captures around it.
-                    captures_before_alt = list(self.captures)
-                    for alt_len, alt_counter in self.match_inner(inp, alt, grp_counter):
-                        self.captures[this_group_num - 1] = inp[:alt_len]
-                        yield alt_len, alt_counter
-                    self.captures = captures_before_alt
-
-            # Case 1: No quantifier.
-            if quantifier is None:
-                for match_len, next_counter in match_group_content_once(input_line, this_group_num):
-                    for rest_len, rest_counter in self.match_inner(input_line[match_len:], rest_of_pattern, next_counter):
-                        yield match_len + rest_len, rest_counter
-                return
+    def _emit_group(self, group_index, alternatives: list, code: list) -> None:
+        """Emits a group as a chain of SPLIT/JUMP pairs, one branch per alternative."""
+        if group_index is not None:
+            code.append([OP_GROUP_START, group_index, None])
+        jumps = []
+        for alt in alternatives[:-1]:
+            split = len(code)
+            code.append([OP_SPLIT, split + 1, None])
+            self._emit_sequence(alt, code)
+            jumps.append(len(code))
+            code.append([OP_JUMP, None, None])
+            code[split][2] = len(code)
+        self._emit_sequence(alternatives[-1], code)
+        for jump in jumps:
+            code[jump][1] = len(code)
+        if group_index is not None:
+            code.append([OP_GROUP_END, group_index, None])
 
-            # Case 2: '?' quantifier (zero or one).
-            if quantifier == "?":
-                # Path 1 (Greedy): Try matching once.
-                for match_len, next_counter in match_group_content_once(input_line, this_group_num):
-                    for rest_len, rest_counter in self.match_inner(input_line[match_len:], rest_of_pattern, next_counter):
-                        yield match_len + rest_len, rest_counter
-                
-                # Path 2: Match zero times.
-                for rest_len, rest_counter in self.match_inner(input_line, rest_of_pattern, group_counter):
-                    yield rest_len, rest_counter
-                return
-            
-            # Case 3: '+' quantifier (one or more).
+    # ---------- Literal Prefilters ----------
+    def _successors(self, code: tuple, pc: int) -> tuple:
+        """Returns the program counters that execution can continue at after `pc`."""
+        op, arg1, _ = code[pc]
+        if op == OP_MATCH:
+            return ()
+        if op == OP_SPLIT:
+            return code[pc][1:]
+        if op == OP_JUMP:
+            return (arg1,)
+        if op == OP_LOOP:
+            return (arg1, pc + 1)
+        return (pc + 1,)
+
+    def _mandatory_pcs(self, code: tuple) -> set:
+        """
+        Returns the program counters that every path from the start of the program to
+        OP_MATCH runs through: the dominators of OP_MATCH, found with the iterative
+        algorithm of Cooper, Harvey and Kennedy in one pass over the whole program.
+        """
+        # Reverse postorder of the instructions reachable from pc 0.
+        postorder = []
+        seen = {0}
+        stack = [(0, iter(self._successors(code, 0)))]
+        while stack:
+            pc, successors = stack[-1]
+            for successor in successors:
+                if successor not in seen:
+                    seen.add(successor)
+                    stack.append((successor, iter(self._successors(code, successor))))
+                    break
+            else:
+                postorder.append(pc)
+                stack.pop()
+        order = postorder[::-1]
+        index = {pc: i for i, pc in enumerate(order)}
+        predecessors = {pc: [] for pc in order}
+        for pc in order:
+            for successor in self._successors(code, pc):
+                predecessors[successor].append(pc)
+
+        idom = {0: 0}
+        changed = True
+        while changed:
+            changed = False
+            for pc in order[1:]:
+                new_idom = None
+                for pred in predecessors[pc]:
+                    if pred not in idom:
+                        continue
+                    if new_idom is None:
+                        new_idom = pred
+                        continue
+                    # Walk both candidates up the dominator tree to their common ancestor.
+                    a, b = pred, new_idom
+                    while a != b:
+                        while index[a] > index[b]:
+                            a = idom[a]
+                        while index[b] > index[a]:
+                            b = idom[b]
+                    new_idom = a
+                if idom.get(pc) != new_idom:
+                    idom[pc] = new_idom
+                    changed = True
+
+        match_pc = len(code) - 1
+        mandatory = {match_pc}
+        pc = match_pc
+        while pc != 0:
+            pc = idom[pc]
+            mandatory.add(pc)
+        return mandatory
+
+    def _extract_required_literal(self, code: tuple) -> bytes | None:
+        """
+        Walks the program for the longest run of literals that every match must contain.
+        Group boundaries and anchors are zero-width, so they do not break a run.
+        """
+        best = b""
+        run = bytearray()
+        mandatory = self._mandatory_pcs(code)
+        for pc, (op, arg1, _) in enumerate(code):
+            if op in (OP_LITERAL, OP_GROUP_START, OP_GROUP_END, OP_BOL, OP_EOL) and pc in mandatory:
+                if op == OP_LITERAL:
+                    run.append(arg1)
+                continue
+            if len(run) > len(best):
+                best = bytes(run)
+            run.clear()
+        return best or None
+
+    def _extract_literal_prefix(self, code: tuple) -> bytes | None:
+        """Returns the literal bytes every match starts with, if any."""
+        prefix = bytearray()
+        for op, arg1, _ in code:
+            if op == OP_LITERAL:
+                prefix.append(arg1)
+            elif op not in (OP_GROUP_START, OP_GROUP_END, OP_BOL):
+                break
+        return bytes(prefix) or None
+
+    def _extract_first_bytes(self, code: tuple) -> bytes | None:
+        """
+        Builds the table of bytes a match can start with, which covers alternations such as
+        (cat|dog) that have no common prefix. Returns None if a match can start anywhere.
+        """
+        table = bytearray(256)
+        for pc in _epsilon_closure(code, [0]):
+            op, arg1, _ = code[pc]
+            if op == OP_LITERAL:
+                table[arg1] = 1
+            elif op == OP_CLASS or op == OP_STAR:
+                for byte in range(256):
+                    if arg1[byte]:
+                        table[byte] = 1
+            elif op == OP_UTF8:
+                # ASCII members, and the lead bytes of the others' encodings.
+                for low, high in arg1:
+                    if low < 0x80:
+                        table[low:min(high, 0x7F) + 1] = b"\x01" * (min(high, 0x7F) + 1 - low)
+                        low = 0x80
+                    if low <= high:
+                        for (first, last), *_ in self._utf8_sequences(low, high):
+                            table[first:last + 1] = b"\x01" * (last + 1 - first)
+            else:
+                # The pattern can match the empty string (possibly at the end of the input)
+                # or starts with a backreference.
+                return None
+        return bytes(table) if 0 in table else None
+
+    # ---------- Bit-Parallel Shift-Or ----------
+    def _build_shift_or(self, ast: list):
+        """
+        Builds the Shift-Or tables for patterns that are a plain sequence of at most 64
+        single-byte atoms, each optionally quantified with '+'. Bit i of the state is set
+        while the first i + 1 atoms match the input ending at the current byte.
+
+        Returns:
+            tuple: (char_mask, loop_mask, accept_mask), or None if the pattern does not qualify.
+        """
+        if not ast or len(ast) > 64:
+            return None
+        char_mask = [0] * 256
+        loop_mask = 0
+        for position, (node_type, table, quantifier) in enumerate(ast):
+            if node_type != "bytes" or quantifier not in (None, "+"):
+                return None
+            bit = 1 << position
+            for byte in range(256):
+                if table[byte]:
+                    char_mask[byte] |= bit
+            # A '+' atom may keep its position active by consuming further matching bytes.
             if quantifier == "+":
-                # A recursive helper for matching the group one-or-more times.
-                # Yields (total_match_length, final_group_counter).
-                def match_plus_group(inp, grp_counter):
-                    # Greedily match the group content once.
-                    for one_len, one_counter in match_group_content_once(inp, grp_counter):
-                        # After matching once, we can either stop or continue.
-                        # Path 1 (Greedy): Recurse to match more.
-                        captures_after_one = list(self.captures)
-                        # When recursing, the group counter must start from the same point, as the group
-                        # numbers are static in the pattern. Passing the returned `one_counter` would
-                        # incorrectly increment the group numbers for each repetition.
-                        for rest_plus_len, rest_plus_counter in match_plus_group(inp[one_len:], grp_counter):
-                             yield one_len + rest_plus_len, rest_plus_counter
-                        self.captures = captures_after_one # Restore for path 2
-
-                        # Path 2: Stop here. This is a valid end for the '+' repetition.
-                        yield one_len, one_counter
-
-                # Use the helper to find all possible repetition lengths, then match the rest of the pattern.
-                for reps_len, reps_counter in match_plus_group(input_line, this_group_num):
-                    for rest_len, rest_counter in self.match_inner(input_line[reps_len:], rest_of_pattern, reps_counter):
-                        yield reps_len + rest_len, rest_counter
-                return
+                loop_mask |= bit
+        return tuple(char_mask), loop_mask, 1 << (len(ast) - 1)
 
-            return # Should be unreachable
-
-        # --- Handle a BACKREFERENCE expression ---
-        if expr_type == "backreference":
-            ref_num = expr_content
-            if len(self.captures) < ref_num or self.captures[ref_num - 1] is None:
-                return # If capture doesn't exist, this path fails.
-            captured_text = self.captures[ref_num - 1]
-            if input_line.startswith(captured_text):
-                cap_len = len(captured_text)
-                # Explore matches for the rest of the pattern.
-                for rest_len, rest_counter in self.match_inner(input_line[cap_len:], rest_of_pattern, group_counter):
-                    yield cap_len + rest_len, rest_counter
-            return
+    # ---------- Backtracking Program ----------
+    def _build_memo_groups(self, code: tuple, num_capture_groups: int) -> tuple:
+        """
+        For every branching instruction (SPLIT, LOOP, STAR), collects the capture registers
+        that are live there: the groups whose last capture may still be read (by a
+        backreference, or by a LOOP testing its iteration for progress) and the groups
+        whose open start may still be closed, before being overwritten. Those registers are
+        part of the memo key, since they decide whether the rest of the match succeeds;
+        dead ones are left out so equivalent states share one key.
+        Non-branching instructions get None and are never memoized.
 
-        # --- Handle an ATOM expression (literal, class, escape, wildcard) ---
-        match_fn = self.get_match_fn(expr_type, expr_content, negated)
+        Returns:
+            tuple: Per instruction, None or (captured groups, started groups).
+        """
+        # Registers: ("capture", g) is the last capture of g, ("start", g) its open start.
+        uses = []
+        defs = []
+        for op, arg1, arg2 in code:
+            if op == OP_BACKREF or (op == OP_LOOP and arg2 is not None):
+                group = arg1 if op == OP_BACKREF else arg2
+                uses.append({("capture", group)} if group < num_capture_groups else set())
+                defs.append(set())
+            elif op == OP_GROUP_START:
+                uses.append(set())
+                defs.append({("start", arg1)})
+            elif op == OP_GROUP_END:
+                # Reads the start only to write the capture, see below.
+                uses.append(set())
+                defs.append({("capture", arg1)})
+            else:
+                uses.append(set())
+                defs.append(set())
+        # Backward liveness analysis, iterated until no live set changes.
+        live = [set() for _ in code]
+        changed = True
+        while changed:
+            changed = False
+            for pc in range(len(code) - 1, -1, -1):
+                live_out = set()
+                for successor in self._successors(code, pc):
+                    live_out |= live[successor]
+                live_in = uses[pc] | (live_out - defs[pc])
+                # A group's start matters only if the capture it closes can still be read.
+                if code[pc][0] == OP_GROUP_END and ("capture", code[pc][1]) in live_out:
+                    live_in.add(("start", code[pc][1]))
+                if live_in != live[pc]:
+                    live[pc] = live_in
+                    changed = True
+        memo_groups = []
+        for pc, (op, _, _) in enumerate(code):
+            if op not in (OP_SPLIT, OP_LOOP, OP_STAR):
+                memo_groups.append(None)
+                continue
+            memo_groups.append((tuple(sorted(g for kind, g in live[pc] if kind == "capture")),
+                                tuple(sorted(g for kind, g in live[pc] if kind == "start"))))
+        return tuple(memo_groups)
 
-        # Case 1: No quantifier.
-        if quantifier is None:
-            if input_line and match_fn(input_line[0]):
-                for rest_len, rest_counter in self.match_inner(input_line[1:], rest_of_pattern, group_counter):
-                    yield 1 + rest_len, rest_counter
-            return
+    def _build_program_arrays(self, code: tuple) -> tuple:
+        """
+        Splits the program into parallel arrays (structure of arrays): the opcodes as
+        array('b'), and both arguments as array('i') with -1 for a missing argument.
+        The arrays are returned as read-only memoryviews, since the program is shared.
+        The distinct class tables of OP_CLASS/OP_STAR are concatenated into one bytes
+        object and their arg1 becomes a table id, so a byte is tested as
+        class_tables[id * 256 + byte]. The code point ranges of OP_UTF8 get ids the same
+        way, see CompiledProgram.char_ranges.
 
-        # Case 2: '+' quantifier (one or more).
-        if quantifier == "+":
-            if not input_line or not match_fn(input_line[0]):
-                return
-            # Greedily find the longest possible sequence of matches.
-            reps = 1
-            while reps < len(input_line) and match_fn(input_line[reps]):
-                reps += 1
-            # Backtrack from longest to shortest.
-            for curr_reps in range(reps, 0, -1):
-                for rest_len, rest_counter in self.match_inner(input_line[curr_reps:], rest_of_pattern, group_counter):
-                    yield curr_reps + rest_len, rest_counter
-            return
+        Returns:
+            tuple: (ops, arg1s, arg2s, class_tables, char_ranges, char_bounds, char_offsets)
+        """
+        ops = array("b")
+        arg1s = array("i")
+        arg2s = array("i")
+        table_ids = {}
+        range_ids = {}
+        for op, arg1, arg2 in code:
+            if op == OP_CLASS or op == OP_STAR:
+                arg1 = table_ids.setdefault(arg1, len(table_ids))
+            elif op == OP_UTF8:
+                arg1 = range_ids.setdefault(arg1, len(range_ids))
+            ops.append(op)
+            arg1s.append(-1 if arg1 is None else arg1)
+            arg2s.append(-1 if arg2 is None else arg2)
+        char_ranges = tuple((tuple(low for low, _ in ranges), tuple(high for _, high in ranges))
+                            for ranges in range_ids)
+        char_bounds = array("i", (bound for ranges in range_ids for pair in ranges for bound in pair))
+        char_offsets = array("i", [0])
+        for ranges in range_ids:
+            char_offsets.append(char_offsets[-1] + 2 * len(ranges))
+        return (memoryview(ops).toreadonly(), memoryview(arg1s).toreadonly(),
+                memoryview(arg2s).toreadonly(), b"".join(table_ids), char_ranges,
+                memoryview(char_bounds).toreadonly(), memoryview(char_offsets).toreadonly())
 
-        # Case 3: '?' quantifier (zero or one).
-        if quantifier == "?":
-            # Path 1: Match the atom once.
-            if input_line and match_fn(input_line[0]):
-                for rest_len, rest_counter in self.match_inner(input_line[1:], rest_of_pattern, group_counter):
-                    yield 1 + rest_len, rest_counter
-            # Path 2: Match the atom zero times.
-            for rest_len, rest_counter in self.match_inner(input_line, rest_of_pattern, group_counter):
-                yield rest_len, rest_counter
-            return
+class RegexEngine:
+    """
+    A simple regular expression engine that supports a subset of regex features,
+    including literals, character classes, escape sequences (\\d, \\w), quantifiers (+, ?, *),
+    the wildcard (.), groups for alternation (cat|dog), quantifiers on groups,
+    multiple and nested backreferences (\\1, \\2), and anchors (^, $).
 
-        # Case 4: '*' quantifier (zero or more).
-        if quantifier == "*":
-            # Greedily find the longest possible sequence of matches.
-            reps = 0
-            while reps < len(input_line) and match_fn(input_line[reps]):
-                reps += 1
-            # Backtrack from longest to shortest (including zero).
-            for curr_reps in range(reps, -1, -1):
-                for rest_len, rest_counter in self.match_inner(input_line[curr_reps:], rest_of_pattern, group_counter):
-                    yield curr_reps + rest_len, rest_counter
-            return
+    The pattern is compiled once into a bytecode program. Read as a Thompson NFA, the
+    program is simulated by a lazily built DFA in a single pass over the input bytes;
+    short linear patterns use a bit-parallel Shift-Or simulation instead. Input is
+    matched as UTF-8 bytes: classes, escapes and '.' match whole UTF-8 characters, and
+    \\d and \\w follow str.isdigit and str.isalnum (plus '_').
+    Patterns that use backreferences are not regular and are executed by an
+    iterative backtracking interpreter over the same program.
+    """
+    def __init__(self, pattern: str):
+        """
+        Initializes the regex engine.
 
-    # ---------- Top-Level Matching Logic ----------
-    def strip_anchors(self, pattern: str) -> tuple:
-        """Checks for '^' and '$' anchors, removes them, and returns boolean flags."""
-        start_anchored = pattern.startswith("^")
-        end_anchored = pattern.endswith("$")
-        inner = pattern[int(start_anchored):-int(end_anchored) or None]
-        return start_anchored, end_anchored, inner
+        Args:
+            pattern (str): The regular expression pattern to be used for matching.
+        """
+        # Store the user-provided regex pattern as an instance variable.
+        self.pattern = pattern
+        # Initialize a list to store the strings captured by groups. Will be sized later.
+        self.captures = []
+        # The encoded input line currently being matched by the backtracker.
+        self.input = b""
+        # Compile the pattern once, up front, instead of re-parsing it while matching. The
+        # program is cached per pattern string and shared, so it is only ever read.
+        self.program = _compile_pattern(pattern)
+        # Lazily populated DFA: {frozenset of program counters: {byte: frozenset}}.
+        start = self.program.dfa_start
+        self.dfa_cache = {} if start is None else {start: {}}
+
+    # ---------- Literal Prefilters ----------
+    def _prefilter_marks(self, data: bytes) -> bytes | None:
+        """Maps each input byte to 1 if a match can start there (when there is no literal prefix)."""
+        program = self.program
+        if program.literal_prefix is None and program.first_byte_table is not None:
+            return data.translate(program.first_byte_table)
+        return None
 
-    def has_match(self, input_line: str, pattern: str) -> bool:
+    def _next_candidate(self, data: bytes, marks: bytes | None, pos: int) -> int:
         """
-        Drives the matching process, handling anchors and consuming the match generator.
+        Returns the first offset >= pos where a match can start, or -1 if there is none.
+        Both searches run in C (a memchr-style `find`), not in the interpreter loop.
         """
-        start_anchored, end_anchored, inner = self.strip_anchors(pattern)
-        # Initialize the captures list with empty slots for each group.
-        self.captures = [None] * self.num_capture_groups
+        prefix = self.program.literal_prefix
+        if prefix is not None:
+            return data.find(prefix, pos)
+        return marks.find(1, pos)
 
-        # If anchored to the start, only try matching from the beginning of the input.
-        if start_anchored:
-            gen = self.match_inner(input_line, inner, 0)
-            if end_anchored:
-                # Must consume the entire string.
-                return any(poss[0] == len(input_line) for poss in gen)
+    # ---------- Bit-Parallel Shift-Or ----------
+    def match_shift_or(self, data: bytes) -> bool:
+        """
+        Simulates the pattern's NFA with one Python int as the set of active positions,
+        advancing it by a shift, an OR and a mask lookup per input byte.
+        """
+        program = self.program
+        char_mask, loop_mask, accept = program.shift_or
+        end_anchored = program.end_anchored
+        prefilter = program.has_prefilter
+        marks = self._prefilter_marks(data) if prefilter else None
+        view = memoryview(data)
+        # A new match attempt enters position 0 on every byte, or only the first if anchored.
+        inject = 1
+        reinject = 0 if program.start_anchored else 1
+        state = 0
+        pos = 0
+        while True:
+            if prefilter:
+                # No match is in progress, so jump straight to the next possible start.
+                pos = self._next_candidate(data, marks, pos)
+                if pos < 0:
+                    return False
+            for byte in view[pos:]:
+                pos += 1
+                state = ((state << 1) | inject | (state & loop_mask)) & char_mask[byte]
+                if state & accept and not end_anchored:
+                    return True
+                if not state:
+                    if not reinject:
+                        return False
+                    if prefilter:
+                        break
+                inject = reinject
             else:
-                # Any match from the start is sufficient.
-                try:
-                    next(gen)
+                return bool(state & accept)
+
+    # ---------- Lazy DFA ----------
+    def _dfa_step(self, dfa_state: frozenset, byte: int) -> frozenset:
+        """Computes (and caches) the DFA transition from `dfa_state` on `byte`."""
+        program = self.program
+        code = program.code
+        targets = []
+        for pc in dfa_state:
+            op, arg1, _ = code[pc]
+            if op == OP_LITERAL:
+                if byte == arg1:
+                    targets.append(pc + 1)
+            elif op == OP_CLASS:
+                if arg1[byte]:
+                    targets.append(pc + 1)
+            elif op == OP_STAR:
+                if arg1[byte]:
+                    targets.append(pc)
+        # Unanchored patterns may start a new match at every position.
+        if not program.start_anchored:
+            targets.append(0)
+        next_state = _epsilon_closure(code, targets)
+        # Keep the start state canonical so `match_dfa` can recognise it by identity.
+        if next_state == program.dfa_start:
+            next_state = program.dfa_start
+
+        if len(self.dfa_cache) >= DFA_CACHE_LIMIT:
+            self.dfa_cache.clear()
+        self.dfa_cache.setdefault(dfa_state, {})[byte] = next_state
+        self.dfa_cache.setdefault(next_state, {})
+        return next_state
+
+    def match_dfa(self, data: bytes) -> bool:
+        """
+        Runs the lazy DFA over the input in a single pass, building any missing
+        transitions on the fly. Whenever the DFA falls back to its start state, no match
+        is in progress and the prefilter skips ahead to the next possible start.
+        """
+        program = self.program
+        cache = self.dfa_cache
+        # OP_MATCH is only reachable through OP_EOL when the pattern ends with '$', so it
+        # accepts mid-input only for patterns that are not end-anchored.
+        accept = program.match_pc
+        end_pc = program.end_pc
+        start = program.dfa_start
+        restart = start if program.has_prefilter else None
+        marks = self._prefilter_marks(data) if restart is not None else None
+        view = memoryview(data)
+        state = start
+        pos = 0
+        while True:
+            if restart is not None:
+                pos = self._next_candidate(data, marks, pos)
+                if pos < 0:
+                    return False
+            for byte in view[pos:]:
+                pos += 1
+                if accept in state:
                     return True
-                except StopIteration:
+                transitions = cache.get(state)
+                next_state = transitions.get(byte) if transitions is not None else None
+                if next_state is None:
+                    next_state = self._dfa_step(state, byte)
+                if not next_state:
+                    # Dead state: no NFA thread survived (only possible when start-anchored).
                     return False
-        # If not anchored, try matching from every possible start position.
-        else:
-            for i in range(len(input_line) + 1):
-                gen = self.match_inner(input_line[i:], inner, 0)
-                if end_anchored:
-                    # The match must go exactly to the end of the original string.
-                    if any(i + poss[0] == len(input_line) for poss in gen):
-                        return True
+                state = next_state
+                if state is restart:
+                    break
+            else:
+                return end_pc in state
+
+    # ---------- Backtracking Interpreter ----------
+    def match_inner(self, start: int) -> int:
+        """
+        The backtracking matcher over the compiled program. Instead of recursing, it runs
+        a single loop over (pc, pos) and keeps an explicit stack of choice points: a
+        branch pushes its alternative and continues with the preferred path, and a failed
+        path resumes from the most recent choice point.
+
+        Branching instructions record their state in `self._fail_memo`. A state reached a
+        second time was already explored (and did not produce a match, or we would have
+        stopped), so it is pruned; without this, patterns like (a|a)*b explore
+        exponentially many paths through identical states.
+
+        Returns:
+            int: The offset where the first match ends, or -1 if there is none.
+        """
+        # Indexing an array boxes a new int on every read; step over list copies instead,
+        # which are cheap to make for a program this size.
+        program = self._line_program
+        ops, arg1s, arg2s = program.ops.tolist(), program.arg1.tolist(), program.arg2.tolist()
+        class_tables = program.class_tables
+        char_ranges = program.char_ranges
+        data = self.input
+        input_len = len(data)
+        memo_groups = program.memo_groups
+        visited = self._fail_memo
+        captures = self.captures = [None] * program.num_capture_groups
+        group_starts = self.group_starts = [None] * program.num_capture_groups
+        # Mutation log of (register list, group, old value), appended on every capture
+        # write so a choice point only has to remember the log length to restore them.
+        log = self._capture_log = []
+        # Choice points: (pc, pos, star_low, log_mark). star_low is -1 for a plain
+        # alternative; otherwise the entry retries the OP_STAR at pc with a run ending at
+        # pos, and shorter runs down to star_low remain to be tried.
+        stack = []
+        pc = 0
+        pos = start
+
+        while True:
+            op = ops[pc]
+            arg1 = arg1s[pc]
+
+            explored = False
+            groups = memo_groups[pc]
+            if groups is not None:
+                key = (pc, pos)
+                captured, started = groups
+                for group in captured:
+                    key += (captures[group],)
+                for group in started:
+                    key += (group_starts[group],)
+                explored = key in visited
+                if not explored:
+                    # Bound memory use. Below FAIL_MEMO_CEILING the bound covers every state
+                    # a polynomial search can reach, since forgetting states brings back
+                    # exponential paths.
+                    if len(visited) >= self._memo_limit:
+                        visited.clear()
+                    visited.add(key)
+
+            if explored:
+                pass # This state was already explored, so this path fails.
+
+            # --- Single-byte atoms ---
+            elif op == OP_LITERAL:
+                if pos < input_len and data[pos] == arg1:
+                    pc += 1
+                    pos += 1
+                    continue
+            elif op == OP_CLASS:
+                if pos < input_len and class_tables[arg1 * 256 + data[pos]]:
+                    pc += 1
+                    pos += 1
+                    continue
+            elif op == OP_UTF8:
+                if pos < input_len:
+                    code_point, length = _decode_utf8(data, pos)
+                    lows, highs = char_ranges[arg1]
+                    i = bisect_right(lows, code_point) - 1
+                    if length and i >= 0 and code_point <= highs[i]:
+                        pc += 1
+                        pos += length
+                        continue
+            elif op == OP_STAR:
+                # Greedily find the longest possible run of matching bytes. Translating the
+                # input through the class table maps every byte to 0 or 1, so the end of the
+                # run is the next 0 and one C-level `find` replaces a per-byte Python loop.
+                marks = self._class_marks.get(arg1)
+                if marks is None:
+                    table = class_tables[arg1 * 256:arg1 * 256 + 256]
+                    marks = self._class_marks[arg1] = data.translate(table)
+                end = marks.find(0, pos)
+                if end < 0:
+                    end = input_len
+                # Take the longest run first; shorter ones are retried on backtracking.
+                if end > pos:
+                    stack.append((pc, end - 1, pos, len(log)))
+                pc += 1
+                pos = end
+                continue
+
+            # --- Control flow ---
+            elif op == OP_SPLIT:
+                stack.append((arg2s[pc], pos, -1, len(log)))
+                pc = arg1
+                continue
+            elif op == OP_JUMP:
+                pc = arg1
+                continue
+            elif op == OP_LOOP:
+                # Repeat greedily, unless the last iteration matched the empty string and
+                # would therefore repeat forever; stopping is the saved alternative.
+                group = arg2s[pc]
+                if group < 0 or captures[group][0] != captures[group][1]:
+                    stack.append((pc + 1, pos, -1, len(log)))
+                    pc = arg1
                 else:
-                    # The first successful match from any position is enough.
-                    try:
-                        next(gen)
-                        return True
-                    except StopIteration:
-                        pass # Continue to the next start position.
+                    pc += 1
+                continue
+
+            # --- Groups and backreferences ---
+            elif op == OP_GROUP_START:
+                log.append((group_starts, arg1, group_starts[arg1]))
+                group_starts[arg1] = pos
+                pc += 1
+                continue
+            elif op == OP_GROUP_END:
+                log.append((captures, arg1, captures[arg1]))
+                captures[arg1] = (group_starts[arg1], pos)
+                pc += 1
+                continue
+            elif op == OP_BACKREF:
+                # If the capture doesn't exist, this path fails.
+                if arg1 < len(captures) and captures[arg1] is not None:
+                    cap_start, cap_end = captures[arg1]
+                    # Compare in place against the input rather than slicing off the remainder.
+                    if data.startswith(data[cap_start:cap_end], pos):
+                        pos += cap_end - cap_start
+                        pc += 1
+                        continue
+            # --- Anchors ---
+            elif op == OP_BOL:
+                if pos == 0:
+                    pc += 1
+                    continue
+            elif op == OP_EOL:
+                if pos == input_len:
+                    pc += 1
+                    continue
+            else: # OP_MATCH
+                return pos
+
+            # The current path failed: resume from the most recent choice point.
+            if not stack:
+                return -1
+            pc, pos, star_low, mark = stack.pop()
+            # Undo the capture writes made since the choice point, newest first.
+            while len(log) > mark:
+                registers, group, value = log.pop()
+                registers[group] = value
+            if star_low >= 0:
+                if pos > star_low:
+                    stack.append((pc, pos - 1, star_low, mark))
+                pc += 1
+
+    # ---------- Top-Level Matching Logic ----------
+    def has_match(self, input_line: str | bytes) -> bool:
+        """
+        Drives the matching process. Short linear patterns run on the Shift-Or matcher and
+        other regular patterns on the lazy DFA; patterns with backreferences are handled
+        by the backtracker, tried from each candidate start position.
+        """
+        # Lines read from files arrive as bytes already; only text needs encoding.
+        if isinstance(input_line, str):
+            data = input_line.encode("utf-8", "surrogateescape")
+        else:
+            data = input_line
+        program = self.program
+        # A line without the pattern's mandatory literal cannot match; reject it in C.
+        if program.required_literal is not None and program.required_literal not in data:
             return False
+        if program.shift_or is not None:
+            return self.match_shift_or(data)
+        if not program.has_backreferences:
+            return self.match_dfa(data)
+
+        # The backtracker indexes into a single bytes object instead of slicing it.
+        self.input = data
+        # States (pc, pos, relevant captures) already explored on this line.
+        self._fail_memo = set()
+        # The input translated through each class table used by OP_STAR, built on demand.
+        self._class_marks = {}
+        input_len = len(self.input)
+        # The program the backtracker runs on this line.
+        self._line_program = program
+        if program.ascii_program is not None and data.isascii():
+            self._line_program = program.ascii_program
+        # Size the memo to the line: one state per (pc, pos), times one capture boundary
+        # per position when captures are part of the key, which is what nested
+        # quantifiers such as ((a+)+)\2 need to stay polynomial.
+        states = len(self._line_program.code) * (input_len + 1)
+        if 2 in self._line_program.native_memo:
+            states *= input_len + 1
+        # The ceiling keeps memory bounded on very long lines. A line that needs more
+        # states clears the memo when it fills up and explores some paths again, which
+        # can take exponential time: memory is bounded, time is not.
+        self._memo_limit = min(FAIL_MEMO_CEILING, max(FAIL_MEMO_LIMIT, states))
+
+        if native_match is not None:
+            # One visited bitset per line: states that failed from one start fail from all.
+            self._visited = bytearray((len(self._line_program.code) * (input_len + 1) + 7) // 8)
+
+        # If anchored to the start, only try matching from the beginning of the input.
+        if program.start_anchored:
+            return self._match_at(0)
+        # If not anchored, try matching from every possible start position.
+        marks = self._prefilter_marks(data) if program.has_prefilter else None
+        i = 0
+        while i <= input_len:
+            if program.has_prefilter:
+                i = self._next_candidate(data, marks, i)
+                if i < 0:
+                    break
+            if self._match_at(i):
+                return True
+            i += 1
+        return False
 
-    def match_pattern(self, input_line: str) -> bool:
+    def _match_at(self, start: int) -> bool:
+        """Runs the backtracker from offset `start`, natively if the extension is built."""
+        if native_match is not None:
+            program = self._line_program
+            end = native_match(program.ops, program.arg1, program.arg2, program.class_tables,
+                               program.char_bounds, program.char_offsets, program.native_memo,
+                               program.memo_groups, self.input, start,
+                               program.num_capture_groups, self._visited, self._fail_memo,
+                               self._memo_limit)
+            return end >= 0
+        return self.match_inner(start) >= 0
+
+    def match_pattern(self, input_line: str | bytes) -> bool:
         """Public entry point for the regex engine."""
-        return self.has_match(input_line, self.pattern)
+        return self.has_match(input_line)
+
+
+@lru_cache(maxsize=256)
+def _compile_pattern(pattern: str) -> CompiledProgram:
+    """
+    Compiles `pattern` with a fresh PatternCompiler, so each distinct pattern is only
+    parsed and compiled once per process however many engines are created for it.
+    """
+    return PatternCompiler(pattern).compile()
 
+def _scan_lines(path: str, engine: "RegexEngine", skip_unreadable: bool = False):
+    """
+    Yields the matching lines of one file as they are found, so a caller can write
+    them out while the scan continues instead of holding every match in memory.
+
+    Args:
+        path (str): The file to scan.
+        engine (RegexEngine): The engine to match lines with.
+        skip_unreadable (bool): Yield no lines instead of raising if the file can't be read.
+
+    Yields:
+        bytes: Each matching line, in file order, with its trailing newline.
+    """
+    try:
+        yield from Main.matching_lines(path, engine)
+    except (IOError, PermissionError):
+        if not skip_unreadable:
+            raise
+
+def _scan(path: str, pattern: str, skip_unreadable: bool = False) -> tuple:
+    """
+    Worker for parallel multi-file search: builds its own engine (engines do not cross
+    process boundaries) and returns the matching lines of one file, which have to be
+    sent back to the parent process as a whole.
+
+    A read error is returned rather than raised: the pool hands out files in chunks,
+    and raising would also discard the results of the other files in the chunk.
+
+    Args:
+        path (str): The file to scan.
+        pattern (str): The regular expression pattern.
+        skip_unreadable (bool): Return no lines instead of an error if the file can't be read.
+
+    Returns:
+        tuple: (matching lines in file order with their trailing newlines, the OSError
+        that stopped the scan or None)
+    """
+    lines = []
+    try:
+        for line in _scan_lines(path, RegexEngine(pattern), skip_unreadable):
+            lines.append(line)
+    except OSError as error:
+        return lines, error
+    return lines, None
 
 class Main:
     """
@@ -415,27 +1368,108 @@ class Main:
     def recursive_find_files(self, dir_path: str, relative_base: str, files_list: list[str]) -> None:
         """Manually recurse through directories to find all file paths (relative to base)."""
         try:
-            for entry in os.listdir(dir_path):
-                full_path = os.path.join(dir_path, entry)
-                if os.path.isfile(full_path):
-                    rel_path = os.path.relpath(full_path, relative_base)
-                    files_list.append(rel_path)
-                elif os.path.isdir(full_path):
-                    self.recursive_find_files(full_path, relative_base, files_list)
+            # os.scandir reports each entry's type from the directory listing itself, so
+            # is_file()/is_dir() need no extra stat() call except for symlinks.
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        rel_path = os.path.relpath(entry.path, relative_base)
+                        files_list.append(rel_path)
+                    elif entry.is_dir():
+                        self.recursive_find_files(entry.path, relative_base, files_list)
         except PermissionError:
             # Ignore permission errors (e.g., can't read some dirs), as per common grep behavior
             pass
 
-    def read_input(self) -> str:
-        """Reads the input string from standard input."""
-        input_line = sys.stdin.read()
-        if input_line.endswith("\n"):
+    @staticmethod
+    def matching_lines(path: str, engine: RegexEngine):
+        """
+        Scans a file for lines matched by `engine`. A regular file is memory-mapped and
+        split on b'\n' with `find`, so lines are matched as bytes without decoding them or
+        reading the file line by line. Pages already scanned are released as the scan
+        moves on, so a large file does not stay resident as a whole.
+
+        Yields:
+            bytes: Each matching line, including its trailing newline if it has one
+            (b'\n' also for a line that ended in b'\r\n').
+        """
+        with open(path, 'rb') as file:
+            info = os.fstat(file.fileno())
+            # Pipes, FIFOs and files such as those in /proc report no size and cannot be
+            # mapped (an empty regular file cannot be mapped either), so read them.
+            if not stat.S_ISREG(info.st_mode) or info.st_size == 0:
+                yield from Main._streamed_matching_lines(file, engine)
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                size = len(mm)
+                # madvise is not available on every platform; without it pages stay mapped.
+                release = getattr(mmap, "MADV_DONTNEED", None)
+                release_at = MMAP_RELEASE_BYTES if release is not None else size
+                start = 0
+                while start < size:
+                    if start >= release_at:
+                        # The pages are backed by the file, so dropping them loses nothing.
+                        mm.madvise(release, 0, start - start % mmap.PAGESIZE)
+                        release_at = start + MMAP_RELEASE_BYTES
+                    end = mm.find(b'\n', start)
+                    if end == -1:
+                        end = size
+                    # Match without the line terminator, treating CRLF like text mode did.
+                    line_end = end - 1 if end > start and mm[end - 1] == 13 else end
+                    if engine.match_pattern(mm[start:line_end]):
+                        # CRLF lines are written with a plain b'\n', as text mode did.
+                        yield mm[start:end + 1] if line_end == end else mm[start:line_end] + b"\n"
+                    start = end + 1
+
+    @staticmethod
+    def _streamed_matching_lines(file, engine: RegexEngine):
+        """
+        The `matching_lines` scan for a file that cannot be mapped: reads it through the
+        buffered binary file object, with the same line terminator handling.
+
+        Yields:
+            bytes: Each matching line, as for `matching_lines`.
+        """
+        for line in file:
+            end = len(line) - 1 if line.endswith(b"\n") else len(line)
+            line_end = end - 1 if end > 0 and line[end - 1] == 13 else end
+            if engine.match_pattern(line[:line_end]):
+                yield line if line_end == end else line[:line_end] + b"\n"
+
+    def scan_files(self, paths: list[str], engine: RegexEngine, skip_unreadable: bool = False):
+        """
+        Scans several files, spread over a pool of worker processes when there is more
+        than one file and more than one CPU, since matching is CPU-bound. Otherwise the
+        files are scanned in-process and their lines are streamed as they are matched.
+
+        Yields:
+            tuple: (path, iterable of matching lines) for every file, in the order of
+            `paths`. In-process, each file's lines must be consumed before the next one.
+        """
+        workers = os.cpu_count() or 1
+        if len(paths) < 2 or workers < 2:
+            for path in paths:
+                yield path, _scan_lines(path, engine, skip_unreadable)
+            return
+        scan = partial(_scan, pattern=engine.pattern, skip_unreadable=skip_unreadable)
+        with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as executor:
+            # map() yields results in submission order, so output stays in file order.
+            for path, (lines, error) in zip(paths, executor.map(scan, paths, chunksize=16)):
+                yield path, lines
+                # Raised once the caller has written this file's lines, as in-process.
+                if error is not None:
+                    raise error
+
+    def read_input(self) -> bytes:
+        """Reads the input from standard input as raw bytes, which the engine matches directly."""
+        input_line = sys.stdin.buffer.read()
+        if input_line.endswith(b"\n"):
             input_line = input_line[:-1]
         return input_line
 
     def __str__(self) -> str:
         """Provides a string representation for debug printing."""
-        return f"Pattern: {self.pattern}\nInput: '{self.input_line}'"
+        return f"Pattern: {self.pattern}\nInput: '{self.input_line.decode('utf-8', 'replace')}'"
 
     def output_result(self, matched: bool):
         """Prints the final result and exits with the appropriate status code."""
@@ -466,36 +1500,45 @@ class Main:
             self.recursive_find_files(abs_target, relative_base, file_paths)
             # Process each found file
             any_matched = False
-            for rel_path in file_paths:
-                full_path = os.path.join(relative_base, rel_path)
-                try:
-                    with open(full_path, 'r') as file:
-                        for original_line in file:
-                            stripped_line = original_line.rstrip('\n')
-                            if engine.match_pattern(stripped_line):
-                                sys.stdout.write(f"{rel_path}:{stripped_line}\n")
-                                any_matched = True
-                except (IOError, PermissionError):
-                    # Skip unreadable files, as per common behavior
-                    continue
+            out = sys.stdout.buffer
+            buf = bytearray()
+            full_paths = [os.path.join(relative_base, rel_path) for rel_path in file_paths]
+            # Skip unreadable files, as per common behavior
+            results = self.scan_files(full_paths, engine, skip_unreadable=True)
+            for rel_path, (_, lines) in zip(file_paths, results):
+                prefix = os.fsencode(rel_path) + b":"
+                for line in lines:
+                    buf += prefix
+                    buf += line
+                    if not line.endswith(b"\n"):
+                        buf += b"\n"
+                    if len(buf) > OUTPUT_FLUSH_BYTES:
+                        out.write(buf)
+                        buf.clear()
+                    any_matched = True
+                # Flush at the end of every file, so output keeps up with the search.
+                out.write(buf)
+                buf.clear()
             sys.exit(0 if any_matched else 1)
         elif isinstance(result[1], list) and result[1] is not None:
             # Multi-file mode (non-recursive)
             self.fileNames = result[1]
             # File mode: process each file line by line (multi-file multi-line support)
             any_matched = False
-            for fileName in self.fileNames:
-                with open(fileName, 'r') as file:
-                    for original_line in file:
-                        stripped_line = original_line.rstrip('\n')
-                        if engine.match_pattern(stripped_line):
-                            # For single file only
-                            if(len(self.fileNames) == 1):
-                                sys.stdout.write(original_line)
-                            # For multiple files
-                            else:
-                                sys.stdout.write(f"{fileName}:{original_line}")
-                            any_matched = True
+            out = sys.stdout.buffer
+            buf = bytearray()
+            for fileName, lines in self.scan_files(self.fileNames, engine):
+                # For single file only, lines are printed as they are; otherwise prefixed.
+                prefix = b"" if len(self.fileNames) == 1 else os.fsencode(fileName) + b":"
+                for line in lines:
+                    buf += prefix
+                    buf += line
+                    if len(buf) > OUTPUT_FLUSH_BYTES:
+                        out.write(buf)
+                        buf.clear()
+                    any_matched = True
+                out.write(buf)
+                buf.clear()
             sys.exit(0 if any_matched else 1)
         else:
             # Stdin mode: keep as single-line (legacy)
@@ -0,0 +1,442 @@
+import io
+import os
+import random
+import re
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import main
+from main import Main, RegexEngine
+
+
+def matches(pattern: str, text: str) -> bool:
+    """Runs the engine on a single line, the way main.py does for stdin input."""
+    return RegexEngine(pattern).match_pattern(text)
+
+
+class AnchorTests(unittest.TestCase):
+    def test_start_anchor(self):
+        self.assertTrue(matches("^log", "log file"))
+        self.assertFalse(matches("^log", "slog"))
+
+    def test_end_anchor(self):
+        self.assertTrue(matches("dog$", "hot dog"))
+        self.assertFalse(matches("dog$", "dogs"))
+
+    def test_both_anchors(self):
+        self.assertTrue(matches("^a+$", "aaa"))
+        self.assertFalse(matches("^a+$", "aaab"))
+        self.assertTrue(matches("^$", ""))
+        self.assertFalse(matches("^$", "a"))
+
+
+class ClassTests(unittest.TestCase):
+    def test_positive_class(self):
+        self.assertTrue(matches("[abc]", "xxcxx"))
+        self.assertFalse(matches("[abc]", "xyz"))
+
+    def test_range_class(self):
+        self.assertTrue(matches("^[a-c0-9]+$", "ab09c"))
+        self.assertFalse(matches("^[a-c0-9]+$", "abd"))
+
+    def test_negated_class(self):
+        self.assertTrue(matches("[^aeiou]", "aeioux"))
+        self.assertFalse(matches("[^aeiou]", "aeiou"))
+
+    def test_escapes(self):
+        self.assertTrue(matches(r"\d\d apples", "12 apples"))
+        self.assertFalse(matches(r"\d", "no digits"))
+        self.assertTrue(matches(r"^\w+$", "snake_case_9"))
+        self.assertFalse(matches(r"^\w+$", "two words"))
+
+    def test_wildcard(self):
+        self.assertTrue(matches("c.t", "cut"))
+        self.assertFalse(matches("c.t", "ct"))
+
+    def test_non_ascii_classes_match_whole_characters(self):
+        self.assertTrue(matches("[é]", "é"))
+        self.assertFalse(matches("[é]", "退"))
+        self.assertFalse(matches("[^é]", "é"))
+        self.assertTrue(matches("^[^a]$", "é"))
+        self.assertTrue(matches("^[à-ÿ]+$", "éü"))
+        self.assertFalse(matches("^[à-ÿ]+$", "éa"))
+
+    def test_wildcard_matches_one_utf8_character(self):
+        self.assertTrue(matches("^.$", "é"))
+        self.assertTrue(matches("^.$", "😀"))
+        self.assertFalse(matches("^.$", "éé"))
+        self.assertTrue(matches(r"^(.)\1$", "éé"))
+        self.assertFalse(matches(r"^(.)\1$", "éè"))
+
+    def test_escapes_match_unicode_characters(self):
+        self.assertTrue(matches(r"^\w+$", "naïve"))
+        self.assertTrue(matches(r"^\w+$", "退_9"))
+        self.assertFalse(matches(r"^\w+$", "naïve!"))
+        self.assertTrue(matches(r"^\d$", "٣"))
+        self.assertFalse(matches(r"\d", "é"))
+        self.assertTrue(matches(r"^(\w+) \1$", "élan élan"))
+
+
+class GroupTests(unittest.TestCase):
+    def test_alternation(self):
+        self.assertTrue(matches("(cat|dog)s", "dogs"))
+        self.assertFalse(matches("(cat|dog)s", "cows"))
+
+    def test_group_quantifiers(self):
+        self.assertTrue(matches("^(ab)+$", "ababab"))
+        self.assertFalse(matches("^(ab)+$", "ababa"))
+        self.assertTrue(matches("^(a|b)*c$", "abbac"))
+        self.assertTrue(matches("^(a|b)*c$", "c"))
+        self.assertTrue(matches("^(cat|dog)?s$", "s"))
+
+    def test_escaped_parentheses_and_classes_in_groups(self):
+        self.assertTrue(matches(r"(a\))", "a)"))
+        self.assertTrue(matches("([)|])+x", "|)x"))
+
+    def test_unclosed_group(self):
+        with self.assertRaises(RuntimeError):
+            RegexEngine("(ab")
+
+    def test_backreference_zero_is_rejected(self):
+        with self.assertRaises(RuntimeError):
+            RegexEngine(r"(a)\0")
+
+
+class BackreferenceTests(unittest.TestCase):
+    def test_single_backreference(self):
+        self.assertTrue(matches(r"(\w+) and \1", "cat and cat"))
+        self.assertFalse(matches(r"(\w+) and \1", "cat and dog"))
+
+    def test_multiple_and_nested_backreferences(self):
+        self.assertTrue(matches(r"(\d+) (\w+) \2 \1", "3 red red 3"))
+        self.assertTrue(matches(r"('(cat) and \2') is the same as \1",
+                                "'cat and cat' is the same as 'cat and cat'"))
+        self.assertFalse(matches(r"('(cat) and \2') is the same as \1",
+                                 "'cat and cat' is the same as 'cat and dog'"))
+
+    def test_anchored_backreference(self):
+        self.assertTrue(matches(r"^(a+)b\1$", "aabaa"))
+        self.assertFalse(matches(r"^(a+)b\1$", "aaba"))
+
+
+class CompiledProgramTests(unittest.TestCase):
+    def test_engines_share_a_read_only_program(self):
+        first, second = RegexEngine(r"(a+)b\1"), RegexEngine(r"(a+)b\1")
+        self.assertIs(first.program, second.program)
+        self.assertFalse(hasattr(first, "code"))
+        with self.assertRaises(TypeError):
+            first.program.ops[0] = 0
+
+
+class DifferentialTests(unittest.TestCase):
+    """Compares the engine with Python's `re` on random patterns and UTF-8 text."""
+
+    ALPHABET = "ab1_ -é退"
+
+    def _atom(self, rng, depth, groups, backrefs):
+        r = rng.random()
+        if r < 0.4:
+            return rng.choice(self.ALPHABET)
+        if r < 0.5:
+            return "."
+        if r < 0.6:
+            return rng.choice([r"\d", r"\w"])
+        if r < 0.7:
+            return "[" + rng.choice(["^", ""]) + rng.choice(["ab", "a-c", "0-9_", " -", "é", "à-ÿ", "a-退"]) + "]"
+        if r < 0.8 and backrefs and groups[0]:
+            return "\\" + str(rng.randint(1, min(groups[0], 9)))
+        if depth < 2:
+            groups[0] += 1
+            alternatives = [self._sequence(rng, depth + 1, groups, backrefs)
+                            for _ in range(rng.randint(1, 3))]
+            return "(" + "|".join(alternatives) + ")"
+        return "a"
+
+    def _sequence(self, rng, depth, groups, backrefs):
+        # Repetition inside a repeated group makes `re` itself backtrack exponentially, so
+        # only top-level atoms and groups get '+' and '*'.
+        quantifiers = ["", "", "?"] if depth else ["", "", "+", "?", "*"]
+        return "".join(self._atom(rng, depth, groups, backrefs) + rng.choice(quantifiers)
+                       for _ in range(rng.randint(0 if depth else 1, 4)))
+
+    def test_matches_re(self):
+        rng = random.Random(1234)
+        for _ in range(400):
+            pattern = self._sequence(rng, 0, [0], backrefs=rng.random() < 0.4)
+            if rng.random() < 0.3:
+                pattern = "^" + pattern
+            if rng.random() < 0.3:
+                pattern += "$"
+            try:
+                expected = re.compile(pattern)
+            except re.error:
+                continue
+            engine = RegexEngine(pattern)
+            for _ in range(6):
+                text = "".join(rng.choice(self.ALPHABET) for _ in range(rng.randint(0, 10)))
+                self.assertEqual(engine.match_pattern(text), expected.search(text) is not None,
+                                 f"pattern {pattern!r} on {text!r}")
+
+
+class BacktrackingBoundTests(unittest.TestCase):
+    def assertFast(self, pattern, text, expected, limit=5.0):
+        start = time.perf_counter()
+        self.assertEqual(matches(pattern, text), expected)
+        self.assertLess(time.perf_counter() - start, limit, pattern)
+
+    def test_nested_quantifiers_do_not_explode(self):
+        self.assertFast(r"(a|a)*b\1", "a" * 40 + "b", False)
+        self.assertFast(r"(a*)*b\1", "a" * 40 + "b", True)
+        self.assertFast(r"^(\w+ ?)*\1!$", "a" * 40 + "?!", False)
+
+    def test_memo_bound_grows_with_the_line(self):
+        # Clearing the memo at a fixed size re-explored the exponential paths of this
+        # pattern; a small floor makes the test cover that without a huge input.
+        with mock.patch("main.FAIL_MEMO_LIMIT", 1024):
+            self.assertFast(r"((a+)+)\2c", "c" + "a" * 120, False)
+
+    def test_memo_bound_has_a_ceiling(self):
+        engine = RegexEngine(r"((a+)+)\2c")
+        with mock.patch("main.FAIL_MEMO_LIMIT", 16), mock.patch("main.FAIL_MEMO_CEILING", 256):
+            self.assertFalse(engine.has_match("c" + "a" * 20))
+        self.assertEqual(engine._memo_limit, 256)
+        self.assertLessEqual(len(engine._fail_memo), 256)
+
+    def test_long_line_does_not_recurse(self):
+        self.assertFast(r"(ab)+\1", "ab" * 6000, True)
+
+
+@unittest.skipIf(main.native_match is None, "the _matcher extension is not built")
+class NativeMatcherTests(unittest.TestCase):
+    CASES = [
+        (r"(a|a)*b\1", "a" * 30 + "b"),
+        (r"^(\w+ ?)*\1!$", "a" * 30 + "?!"),
+        (r"((a+)+)\2c", "c" + "a" * 60),
+        (r"(\w+) and \1", "cat and cat"),
+        (r"(é|.)+\1$", "xéé"),
+    ]
+
+    def test_native_and_python_agree_quickly(self):
+        for pattern, text in self.CASES:
+            start = time.perf_counter()
+            native = matches(pattern, text)
+            self.assertLess(time.perf_counter() - start, 5.0, pattern)
+            with mock.patch("main.native_match", None):
+                self.assertEqual(native, matches(pattern, text), pattern)
+
+
+class MatchingLinesTests(unittest.TestCase):
+    def _lines(self, content: bytes, pattern: str) -> list[bytes]:
+        with tempfile.NamedTemporaryFile(delete=False) as file:
+            file.write(content)
+        try:
+            return list(Main.matching_lines(file.name, RegexEngine(pattern)))
+        finally:
+            os.unlink(file.name)
+
+    def test_matching_lines_keep_their_newlines(self):
+        self.assertEqual(self._lines(b"apple\nbanana\ncherry\n", "an"), [b"banana\n"])
+
+    def test_last_line_without_newline(self):
+        self.assertEqual(self._lines(b"apple\nbanana", "a$"), [b"banana"])
+
+    def test_crlf_lines_match_and_print_without_carriage_return(self):
+        self.assertEqual(self._lines(b"apple\r\nbanana\r\n", "a$"), [b"banana\n"])
+        self.assertEqual(self._lines(b"apple\r\nbanana\r", "a$"), [b"banana\n"])
+
+    def test_empty_file(self):
+        self.assertEqual(self._lines(b"", "a"), [])
+
+    def test_empty_lines(self):
+        self.assertEqual(self._lines(b"a\n\nb\n", "^$"), [b"\n"])
+
+    def test_pipe_is_read_without_mapping(self):
+        read_fd, write_fd = os.pipe()
+        with os.fdopen(write_fd, "wb") as writer:
+            writer.write(b"apple\r\nbanana\r\ncan")
+        try:
+            path = f"/dev/fd/{read_fd}"
+            if not os.path.exists(path):
+                self.skipTest("no /dev/fd on this platform")
+            self.assertEqual(list(Main.matching_lines(path, RegexEngine("an"))),
+                             [b"banana\n", b"can"])
+        finally:
+            os.close(read_fd)
+
+
+def run_main(*args: str, stdin: bytes = b"") -> tuple[int, bytes]:
+    """Runs the command line with `args` on `stdin`, returning its exit code and raw stdout."""
+    stdout = io.TextIOWrapper(io.BytesIO())
+    with mock.patch("sys.argv", ["main.py", *args]), mock.patch("sys.stdout", stdout), \
+            mock.patch("sys.stdin", io.TextIOWrapper(io.BytesIO(stdin))):
+        try:
+            Main().run()
+            code = 0
+        except SystemExit as exit:
+            code = exit.code
+        finally:
+            stdout.flush()
+    return code, stdout.buffer.getvalue()
+
+
+class ScanFilesTests(unittest.TestCase):
+    def test_single_file_is_streamed(self):
+        with tempfile.NamedTemporaryFile(delete=False) as file:
+            file.write(b"an\nb\nan\n")
+        try:
+            [(path, lines)] = Main().scan_files([file.name], RegexEngine("an"))
+            self.assertEqual(path, file.name)
+            self.assertNotIsInstance(lines, list)
+            self.assertEqual(next(iter(lines)), b"an\n")
+        finally:
+            os.unlink(file.name)
+
+    def test_unreadable_file_is_skipped(self):
+        missing = os.path.join(tempfile.gettempdir(), "no-such-file-for-grep-tests")
+        [(_, lines)] = Main().scan_files([missing], RegexEngine("a"), skip_unreadable=True)
+        self.assertEqual(list(lines), [])
+        [(_, lines)] = Main().scan_files([missing], RegexEngine("a"))
+        with self.assertRaises(IOError):
+            list(lines)
+
+
+class ParallelScanTests(unittest.TestCase):
+    """Runs multi-file searches on the process pool, whatever the machine's CPU count."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.directory.name, "tree")
+        os.makedirs(os.path.join(self.root, "sub"))
+        self.paths = []
+        for name, content in [("a.txt", b"cat\ndog\n"), ("b.txt", b"bird\n"),
+                              ("sub/c.txt", b"a cat\ncats\n")]:
+            path = os.path.join(self.root, name)
+            with open(path, "wb") as file:
+                file.write(content)
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_with_cpus(self, cpus: int, *args: str) -> tuple[int, bytes]:
+        with mock.patch("main.os.cpu_count", return_value=cpus):
+            return run_main(*args)
+
+    def test_multi_file_output_keeps_file_order(self):
+        code, output = self.run_with_cpus(4, "-E", "cat", *self.paths)
+        self.assertEqual(code, 0)
+        a, _, c = (os.fsencode(path) for path in self.paths)
+        self.assertEqual(output, a + b":cat\n" + c + b":a cat\n" + c + b":cats\n")
+        self.assertEqual(self.run_with_cpus(1, "-E", "cat", *self.paths), (code, output))
+
+    def test_recursive_output_matches_in_process_scan(self):
+        code, output = self.run_with_cpus(4, "-r", "-E", "cat", self.root)
+        self.assertEqual(code, 0)
+        self.assertEqual(sorted(output.splitlines()),
+                         [b"tree/a.txt:cat", b"tree/sub/c.txt:a cat", b"tree/sub/c.txt:cats"])
+        self.assertEqual(self.run_with_cpus(1, "-r", "-E", "cat", self.root), (code, output))
+
+    def test_unreadable_file_fails_after_earlier_output(self):
+        missing = os.path.join(self.root, "missing.txt")
+        for cpus in (1, 4):
+            stdout = io.TextIOWrapper(io.BytesIO())
+            with mock.patch("main.os.cpu_count", return_value=cpus), \
+                    mock.patch("sys.argv", ["main.py", "-E", "cat", self.paths[0], missing]), \
+                    mock.patch("sys.stdout", stdout):
+                with self.assertRaises(FileNotFoundError):
+                    Main().run()
+            self.assertEqual(stdout.buffer.getvalue(), os.fsencode(self.paths[0]) + b":cat\n")
+
+
+class RecursiveSearchTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.directory.name, "tree")
+        for name in ["a.txt", "deep/er/b.txt", "locked/c.txt"]:
+            path = os.path.join(self.root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                file.write(b"cat\n")
+        os.symlink(os.path.join(self.root, "a.txt"), os.path.join(self.root, "link.txt"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_nested_files_and_symlinks_are_found(self):
+        code, output = run_main("-r", "-E", "cat", self.root)
+        self.assertEqual(code, 0)
+        self.assertEqual(sorted(output.splitlines()),
+                         [b"tree/a.txt:cat", b"tree/deep/er/b.txt:cat",
+                          b"tree/link.txt:cat", b"tree/locked/c.txt:cat"])
+
+    def test_unreadable_directory_is_skipped(self):
+        locked = os.path.join(self.root, "locked")
+        scandir = os.scandir
+
+        def guarded_scandir(path):
+            if path == locked:
+                raise PermissionError(path)
+            return scandir(path)
+
+        with mock.patch("main.os.scandir", guarded_scandir):
+            code, output = run_main("-r", "-E", "cat", self.root)
+        self.assertEqual(code, 0)
+        self.assertEqual(sorted(output.splitlines()),
+                         [b"tree/a.txt:cat", b"tree/deep/er/b.txt:cat", b"tree/link.txt:cat"])
+
+    def test_no_match_exits_with_one(self):
+        self.assertEqual(run_main("-r", "-E", "dog", self.root), (1, b""))
+
+
+class OutputBufferTests(unittest.TestCase):
+    """Output is batched in a buffer; a small flush size makes it flush mid-file."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.directory.name, "tree")
+        os.makedirs(self.root)
+        self.lines = [b"line %d\n" % i if i % 3 else b"skip %d\n" % i for i in range(500)]
+        self.paths = []
+        for name, content in [("a.txt", b"".join(self.lines)), ("b.txt", b"line\nno newline")]:
+            path = os.path.join(self.root, name)
+            with open(path, "wb") as file:
+                file.write(content)
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_flushed_output_is_complete_and_ordered(self):
+        expected = b"".join(line for line in self.lines if line.startswith(b"line"))
+        with mock.patch("main.OUTPUT_FLUSH_BYTES", 64):
+            self.assertEqual(run_main("-E", "line", self.paths[0]), (0, expected))
+            code, output = run_main("-E", "line", *self.paths)
+        prefix = os.fsencode(self.paths[0]) + b":"
+        b_prefix = os.fsencode(self.paths[1]) + b":"
+        self.assertEqual(code, 0)
+        self.assertEqual(output, b"".join(prefix + line for line in expected.splitlines(True))
+                         + b_prefix + b"line\n" + b_prefix + b"no newline")
+
+    def test_recursive_output_ends_every_line(self):
+        with mock.patch("main.OUTPUT_FLUSH_BYTES", 64):
+            code, output = run_main("-r", "-E", "newline", self.root)
+        self.assertEqual((code, output), (0, b"tree/b.txt:no newline\n"))
+
+
+class StdinTests(unittest.TestCase):
+    def test_stdin_is_matched_as_bytes(self):
+        code, output = run_main("-E", "caf", stdin=b"caf\xff\n")
+        self.assertEqual(code, 0)
+        self.assertIn(b"Pattern matched :)", output)
+        self.assertEqual(run_main("-E", "^café$", stdin="café\n".encode())[0], 0)
+        self.assertEqual(run_main("-E", "^caf.$", stdin=b"caf\xff")[0], 1)
+
+    def test_trailing_newline_is_stripped(self):
+        self.assertEqual(run_main("-E", "^a$", stdin=b"a\n")[0], 0)
+        self.assertEqual(run_main("-E", "x", stdin=b"")[0], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()